@@ -7,15 +7,144 @@ Copyright (c) 2025 zhangh
 import json
 import datetime
 import shutil
+import tempfile
 
 import os
 import re
 import sys
 import time
 import threading
+import queue
+import bisect
+import functools
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, ttk, messagebox
 import difflib
+import textwrap
+import traceback
+import zlib
+
+# 某一版本知识库的标题索引，整体替换，后台搜索拿到的这一份不会再被修改
+_HeadingIndex = namedtuple('_HeadingIndex', ['headings', 'positions', 'normalized', 'char_index', 'codes', 'offsets'])
+
+# 标题识别用的正则表达式，模块加载时编译一次
+_MD_HEADING_RE = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
+_UNDERLINE_HEADING_RE = re.compile(r'^(.+)\n([=\-]{3,})$', re.MULTILINE)
+_NUMBER_HEADING_RE = re.compile(r'^(\d+\.)+\s+(.+)$', re.MULTILINE)
+_UPPER_LINE_RE = re.compile(r'^([A-Z\s]{5,})$', re.MULTILINE)
+
+# Markdown行内格式：加粗、斜体、行内代码，合并成一个正则一次扫描
+# Markdown块级元素：标题、代码块围栏、列表项
+_BLOCK_RE = re.compile(r'^(?P<h>#{1,4}) |^\s*(?P<fence>```)|^\s*(?P<bullet>[-*]) (?=.*\S)')
+_HEADING_TAG = {1: "h1", 2: "h2", 3: "h3", 4: "h4"}
+_INLINE_RE = re.compile(r'\*\*(?P<bold>.+?)\*\*|(?<!\*)\*(?P<italic>[^*]+)\*(?!\*)|`(?P<code>[^`]+)`')
+# Markdown标记字符，按上下文定位时去掉
+_MD_MARK_RE = re.compile(r'[#*`_]')
+# 按上下文定位时的搜索锚点：较长的英文/数字串或连续的中文
+_ANCHOR_RE = re.compile(r'[A-Za-z0-9]{5,}|[\u4e00-\u9fff]{3,}')
+
+# 定位时高亮当前行及前后几行，离当前行越远颜色越浅
+_POSITION_AFTER_TAGS = tuple(f"position_highlight_after{i}" for i in range(1, 6))
+_POSITION_HIGHLIGHT_TAGS = {"position_highlight": "yellow", "position_highlight_before": "#FFFFDD"}
+_POSITION_HIGHLIGHT_TAGS.update(
+    (tag, f"#FFFF{max(204, 255 - i * 10):02X}") for i, tag in enumerate(_POSITION_AFTER_TAGS, 1))
+
+# 关键词提取用的正则表达式
+_CJK_RE = re.compile('[\u4e00-\u9fff]')
+_ENG_WORD_RE = re.compile(r'\b[a-zA-Z]{3,}\b')
+_TECH_TERM_RE = re.compile(r'\b[a-zA-Z0-9]+(?:[._-][a-zA-Z0-9]+)*\b')
+
+# 一次搜索最多使用的关键词数量
+_MAX_KEYWORDS = 16
+
+# 段落之间的空行
+_PARAGRAPH_SEP_RE = re.compile(r'\n\s*\n')
+
+# 主窗口初始大小
+_WINDOW_WIDTH, _WINDOW_HEIGHT = 1200, 800
+
+# 标签按钮的固定外观，启动时写入Tk选项数据库，创建标签时只需传文本、颜色和命令
+_TAG_CHIP_OPTIONS = {
+    '*TagChip.borderWidth': 1,
+    '*TagChip.relief': 'raised',
+    '*TagChip.tag.font': 'Arial 12',
+    '*TagChip.tag.padX': 1,
+    '*TagChip.tag.padY': 1,
+    '*TagChip.tag.relief': 'flat',
+    '*TagChip.tag.activeBackground': '#d0d0d0',
+    '*TagChip.tag.cursor': 'hand2',
+    '*TagChip.count.font': 'Arial 8',
+    '*TagChip.count.foreground': '#555555',
+    '*TagChip.count.width': 2,
+    '*TagChip.count.padX': 0,
+    '*TagChip.close.font': 'Arial 8 bold',
+    '*TagChip.close.width': 1,
+    '*TagChip.close.height': 1,
+    '*TagChip.close.padX': 0,
+    '*TagChip.close.padY': 0,
+    '*TagChip.close.relief': 'flat',
+    '*TagChip.close.activeBackground': '#ff9999',
+    '*TagChip.close.cursor': 'hand2',
+}
+
+# 使用帮助和关于信息，模块加载时去掉缩进
+_HELP_TEXT = textwrap.dedent("""
+            知识库语音导航系统 - 使用帮助
+
+            基本操作:
+            -----------
+            1. 加载知识库:
+               - 点击"文件" → "打开知识库"选择Markdown或文本文件
+
+            2. 浏览内容:
+               - 直接滚动浏览文档内容
+               - 点击右侧目录树跳转到对应章节
+
+            3. 搜索功能:
+               - 在搜索框输入关键词，按Enter或点击"搜索"
+               - 点击左侧结果列表跳转到匹配位置
+               - 使用"清除"按钮重置搜索结果
+
+            4. 语音功能:
+               - 点击"开始监听"启动语音识别
+               - 说出要查找的内容或关键词
+               - 使用"处理长对话"分析多句组合查询
+
+            高级功能:
+            -----------
+            - 更改语音引擎: "设置" → "语音识别引擎"
+            - 调整模糊匹配: "设置" → "搜索设置"和"模糊匹配灵敏度"
+            - 字体调整: "视图" → "放大字体"/"缩小字体"
+            - 目录展开/折叠: "视图" → "展开所有目录"/"折叠所有目录"
+
+            快捷操作:
+            -----------
+            - 搜索框中按Enter直接搜索
+            - 语音识别后自动执行搜索
+            - 点击搜索结果或目录项快速跳转
+        """).strip()
+
+_ABOUT_TEXT = textwrap.dedent("""
+            知识库语音导航系统
+
+            版本: 1.0
+
+            这是一个帮助用户通过语音和文本搜索快速浏览知识库的工具。
+            支持Markdown和文本格式的知识库文件，提供语音控制、模糊匹配等功能。
+
+            功能特点:
+            - 支持语音搜索和导航
+            - 智能关键词提取和模糊匹配
+            - 多种语音引擎支持
+            - 长语句理解和处理
+
+            © 2025 知识库语音导航系统团队
+        """).strip()
 
 # 尝试导入可选依赖项
 try:
@@ -28,6 +157,9 @@ except ImportError:
 try:
     import jieba
 
+    # 词典缓存默认放在系统临时目录，被清理后启动时要重新构建，改放到程序所在目录（与启动时的工作目录无关）
+    jieba.dt.tmp_dir = os.path.dirname(os.path.abspath(__file__))
+
     JIEBA_AVAILABLE = True
 except ImportError:
     JIEBA_AVAILABLE = False
@@ -35,29 +167,216 @@ except ImportError:
 try:
     import nltk
     from nltk.tokenize import word_tokenize
+    from nltk.corpus import stopwords
 
+    # 停用词表只在启动时读取一次；语料缺失时不在启动时下载，由后台线程补齐(_download_nltk_data)
     try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        nltk.download('punkt', quiet=True)
-    try:
-        nltk.data.find('corpora/stopwords')
+        _STOPWORDS_EN = frozenset(stopwords.words('english'))
     except LookupError:
-        nltk.download('stopwords', quiet=True)
-    from nltk.corpus import stopwords
+        _STOPWORDS_EN = None
 
     NLTK_AVAILABLE = True
 except ImportError:
     NLTK_AVAILABLE = False
+    _STOPWORDS_EN = None
 
 try:
-    from vosk import Model, KaldiRecognizer
+    from vosk import Model, KaldiRecognizer, SetLogLevel
     import json
 
+    # 关闭Kaldi自身的日志输出，识别时不再逐条写终端
+    SetLogLevel(-1)
+
     VOSK_AVAILABLE = True
 except ImportError:
     VOSK_AVAILABLE = False
 
+try:
+    from google.cloud import speech as gcloud_speech
+
+    GCLOUD_SPEECH_AVAILABLE = True
+except ImportError:
+    GCLOUD_SPEECH_AVAILABLE = False
+
+try:
+    import ahocorasick
+
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    from rapidfuzz import fuzz, process
+
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+try:
+    import numpy as np
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _ratio_batch(query, corpus_flat, offsets, cutoff):
+        """批量计算查询与各标题的相似度(0-100)，低于cutoff的记为0"""
+        n = offsets.shape[0] - 1
+        m = query.shape[0]
+        scores = np.zeros(n, dtype=np.float64)
+        for k in prange(n):
+            start = offsets[k]
+            length = offsets[k + 1] - start
+            total = m + length
+            # 长度差决定了相似度上限，达不到阈值的直接跳过
+            if total == 0 or 200.0 * min(m, length) / total < cutoff:
+                continue
+
+            # 单行动态规划求最长公共子序列
+            row = np.zeros(length + 1, dtype=np.int32)
+            for i in range(m):
+                diag = 0
+                for j in range(1, length + 1):
+                    above = row[j]
+                    if query[i] == corpus_flat[start + j - 1]:
+                        row[j] = diag + 1
+                    elif row[j - 1] > above:
+                        row[j] = row[j - 1]
+                    diag = above
+
+            ratio = 200.0 * row[length] / total
+            if ratio >= cutoff:
+                scores[k] = ratio
+        return scores
+
+
+@functools.lru_cache(maxsize=1024)
+def _extract_keywords(text):
+    """从文本中提取重要关键词，支持中英文，返回去重后按出现顺序排列的元组"""
+    keywords = []
+
+    # 对于中文文本，使用jieba分词（如果可用）
+    chinese_text = _CJK_RE.search(text) is not None
+    if chinese_text and JIEBA_AVAILABLE:
+        words = jieba.cut(text)
+        # 过滤掉常见词和短词
+        keywords = [word for word in words if len(word) >= 2 and not word.isdigit()]
+
+    # 对于英文和混合文本
+    if NLTK_AVAILABLE:
+        # 使用NLTK处理英文
+        try:
+            if _STOPWORDS_EN is None:
+                raise LookupError("stopwords")
+            words = word_tokenize(text)
+            eng_keywords = [word.lower() for word in words
+                            if word.isalnum() and len(word) > 2
+                            and word.lower() not in _STOPWORDS_EN]
+            keywords.extend(eng_keywords)
+        except:
+            # 如果NLTK失败，回退到简单方法
+            eng_words = _ENG_WORD_RE.findall(text)
+            keywords.extend([word.lower() for word in eng_words])
+    else:
+        # 不使用NLTK的简单方法
+        eng_words = _ENG_WORD_RE.findall(text)
+        keywords.extend([word.lower() for word in eng_words])
+
+    # 提取技术术语和特殊格式词
+    tech_terms = _TECH_TERM_RE.findall(text)
+    tech_terms = [term for term in tech_terms if len(term) > 3 and ('.' in term or '_' in term or '-' in term)]
+    keywords.extend(tech_terms)
+
+    # 如果没有找到任何关键词，使用原始查询
+    if not keywords and len(text) < 50:
+        keywords.append(text)
+
+    # 去除重复项（不区分大小写），保持出现顺序
+    unique = {}
+    for keyword in keywords:
+        unique.setdefault(keyword.lower(), keyword)
+
+    # 包含另一个关键词的较长关键词能匹配到的内容，较短的关键词都能匹配到，不必再单独搜索
+    keywords = [keyword for lower, keyword in unique.items()
+                if not any(other and other != lower and other in lower for other in unique)]
+
+    # 限制关键词数量，每个关键词都要扫描一遍标题和段落
+    return tuple(keywords[:_MAX_KEYWORDS])
+
+
+def _download_nltk_data():
+    """后台线程中下载缺失的NLTK语料，下载期间关键词提取使用简单方法"""
+    global _STOPWORDS_EN
+    downloaded = False
+    try:
+        try:
+            nltk.data.find('tokenizers/punkt')
+        except LookupError:
+            nltk.download('punkt', quiet=True)
+            downloaded = True
+
+        if _STOPWORDS_EN is None:
+            nltk.download('stopwords', quiet=True)
+            downloaded = True
+            _STOPWORDS_EN = frozenset(stopwords.words('english'))
+    except Exception as e:
+        print(f"下载NLTK语料失败: {type(e).__name__}: {e}")
+
+    # 语料就绪前缓存的是简单方法的结果
+    if downloaded:
+        _extract_keywords.cache_clear()
+
+
+
+@functools.lru_cache(maxsize=256)
+def _tag_color(tag_text):
+    """根据标签文本生成一个柔和的背景色，同一标签每次启动颜色相同"""
+    # hash()对字符串的结果每次启动都不同，改用crc32
+    color_seed = zlib.crc32(tag_text.encode('utf-8')) % 1000
+    r = min(230, max(180, (color_seed % 5) * 10 + 180))
+    g = min(240, max(200, ((color_seed // 5) % 5) * 10 + 200))
+    b = min(250, max(220, ((color_seed // 25) % 5) * 10 + 220))
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _fuzzy_ratios(keyword, texts, cutoff):
+    """用RapidFuzz计算关键词与每个文本的相似度(0-100)，低于cutoff的记为0"""
+    ratios = [0] * len(texts)
+    for _, score, i in process.extract(keyword, texts, scorer=fuzz.ratio,
+                                       score_cutoff=cutoff, limit=None):
+        ratios[i] = score
+    return ratios
+
+
+def _similarity(a, b, cutoff):
+    """两个文本的相似度(0-100)，达不到cutoff时返回0；有RapidFuzz时用其C++实现，否则用difflib"""
+    if RAPIDFUZZ_AVAILABLE:
+        return fuzz.ratio(a, b, score_cutoff=cutoff)
+
+    # difflib较慢，先用长度和字符构成估算上限
+    total = len(a) + len(b)
+    if total and 200 * min(len(a), len(b)) < cutoff * total:
+        return 0
+    matcher = difflib.SequenceMatcher(None, a, b)
+    if matcher.quick_ratio() * 100 < cutoff:
+        return 0
+    return matcher.ratio() * 100
+
+
+def _keywords_in_texts(keywords, texts):
+    """用Aho-Corasick自动机一次扫描每个文本，返回各文本包含的小写关键词集合，不可用时返回None"""
+    words = {keyword.lower() for keyword in keywords}
+    if not AHOCORASICK_AVAILABLE or not words or '' in words:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for word in words:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return [{word for _, word in automaton.iter(text)} for text in texts]
 
 # 创建自定义无声消息框
 class SilentMessageBox:
@@ -70,18 +389,22 @@ class SilentMessageBox:
         dialog.transient(self.root)
         dialog.grab_set()
 
-        # 计算合适的窗口大小
-        max_line_length = max(len(line) for line in message.split('\n'))
+        # 计算合适的窗口大小（宽度有上限，只需看前面几十行）
+        max_line_length = max(map(len, islice(message.splitlines(), 64)), default=0)
         width = min(max(300, max_line_length * 7), 500)
         height = min(200 + message.count('\n') * 20, 400)
 
         dialog.geometry(f"{width}x{height}")
 
-        # 添加消息文本
-        text = scrolledtext.ScrolledText(dialog, wrap=tk.WORD)
-        text.insert(tk.END, message)
-        text.config(state=tk.DISABLED)
-        text.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        # 添加消息文本 - 短消息用Label即可，只有长文本才需要带滚动条的文本框
+        if message.count('\n') < 8 and len(message) < 400:
+            label = tk.Label(dialog, text=message, justify=tk.LEFT, anchor=tk.W, wraplength=width - 40)
+            label.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        else:
+            text = scrolledtext.ScrolledText(dialog, wrap=tk.WORD)
+            text.insert(tk.END, message)
+            text.config(state=tk.DISABLED)
+            text.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
         # 添加确定按钮
         ok_button = tk.Button(dialog, text="确定", width=10, command=dialog.destroy)
@@ -148,7 +471,7 @@ class KnowledgeNavigator:
     def __init__(self, root):
         self.root = root
         self.root.title("知识库语音导航系统")
-        self.root.geometry("1200x800")
+        self.root.geometry(f"{_WINDOW_WIDTH}x{_WINDOW_HEIGHT}")
 
         self.style = ttk.Style()
         self.style.configure("heading_match.Treeview.Item", background="#e6f0ff")
@@ -158,11 +481,21 @@ class KnowledgeNavigator:
         self.knowledge_base = ""
         self.knowledge_path = None
         self.heading_positions = []  # 存储所有标题及其位置
+        self._line_starts = array('q', [0])  # 每一行在知识库文本中的起始位置
+        self._md_runs = []  # Markdown渲染时待插入的(标签, 文本片段)
+        self._md_line = 1
+        self._rendered_lines = array('i')  # Markdown原文每一行渲染后所在的行号
+        self._index_headings()
         self.current_matches = []
         self.listening = False
         self.speech_engine = "Google"  # 默认使用Google
         self.fuzzy_ratio = 70  # 默认模糊匹配阈值
 
+        # 解析结果缓存: (路径, 修改时间, 大小) -> (内容, 标题列表)
+        self._parse_cache = OrderedDict()
+        self.max_parse_cache = 4
+        self._toc_key = None  # 当前目录树对应的缓存键
+
         # 最近文件历史
         self.recent_files = []
         self.max_recent_files = 5
@@ -188,17 +521,28 @@ class KnowledgeNavigator:
 
         # Vosk相关状态
         self.vosk_model = None
+        self._vosk_lock = threading.Lock()  # 防止后台预加载和开始监听时重复加载模型
+        self._vosk_recognizer = None  # 实时监听用的(模型, 识别器)，重复使用时只需Reset
 
         # 长对话相关
-        self.audio_buffer = []
         self.max_buffer_size = 5  # 保存的音频段数量
-        self.text_history = []
+        self.audio_buffer = deque(maxlen=self.max_buffer_size)  # 超出长度时自动丢弃最早的
+        self.text_history = deque(maxlen=5)
 
         # 标签相关属性 - 确保放在create_ui()调用前
         self.tags = []  # List to store search keyword tags
         self.tag_buttons = []  # List to store tag button widgets
         self.tag_frame = None  # Frame to hold the tags
         self.tag_frame_main = None  # Main container for the tag frame
+        self._tag_rows = []  # 标签按钮所在的各行框架
+        self._resize_job = None  # 窗口宽度变化后延迟执行的重新布局
+        self._save_tags_after_id = None  # 延迟保存标签的定时器
+        self._tag_count_job = None  # 延迟更新标签计数的定时器
+        self._tag_count_shown = {}  # 标签文本 -> 计数标签当前显示的(文字, 颜色)
+        self._pending_search_job = None  # 语音触发的延迟搜索
+        self._pending_jump = None  # 延迟执行的滚动和高亮
+        self._toc_sync_item = None  # 为同步目录而选中的项，其选择事件不再跳转
+        self._pending_tags_file = None  # 延迟保存的目标文件
 
         # 搜索结果相关属性
         self.search_filter = {
@@ -211,18 +555,57 @@ class KnowledgeNavigator:
         self.search_sort = 'relevance'  # 'relevance', 'position', 'level'
         self.last_matches = []  # 存储上一次的搜索结果，用于重新排序和过滤
         self.last_search_query = ""  # 最近的搜索查询
-        self.search_cache = {}  # 搜索结果缓存
+        self.search_cache = OrderedDict()  # 搜索结果缓存(LRU)
+        self.max_search_cache = 128
+        self._kb_version = 0  # 知识库内容版本，变化后旧的搜索缓存自动失效
+        self._hl_cache = OrderedDict()  # 查询 -> 高亮用的正则或自动机
+        self._hl_lock = threading.Lock()  # 后台搜索和主线程都会读写_hl_cache
+        self._kb_lower_cache = (-1, "")  # (知识库版本, 小写的知识库文本)，整体替换以便后台线程读取
+        self._pair_cache = {}  # (起始标记, 结束标记) -> 知识库中的成对位置
+        self._pair_cache_version = -1
+        self._tag_counts = {}  # 标签文本 -> 标题匹配数
+        self._tag_counts_version = -1
+        self._rendered_text = None  # 当前界面上显示的知识库文本
+        self._ctx_cache = OrderedDict()  # 按上下文定位的结果，内容区重绘后清空
+        self._last_line = None  # 内容区最后一行的行号，内容变化时置为None
+        self._paragraph_cache = (-1, [], array('q'))  # (知识库版本, 预处理后的段落, 各段落起始位置)
+        self._rendered_path = None
+        self._help_window = None  # 帮助窗口，关闭时只隐藏，再次打开时复用
+
+        # 搜索在单独的后台线程中计算，避免界面卡顿
+        self._search_exec = ThreadPoolExecutor(max_workers=1)
+        self._search_seq = 0  # 最近一次提交的搜索序号
+        self._search_future = None  # 最近一次提交的搜索任务
+        self._closing = False  # 窗口正在关闭，后台任务不再回调主线程
+        self._status_queue = queue.Queue(maxsize=64)  # 后台线程送来的状态栏消息
+
+        # jieba首次分词时才加载词典，提前在后台加载，避免第一次搜索卡顿
+        if JIEBA_AVAILABLE:
+            threading.Thread(target=jieba.initialize, daemon=True).start()
+
+        # NLTK语料缺失时在后台下载，不阻塞窗口显示
+        if NLTK_AVAILABLE:
+            threading.Thread(target=_download_nltk_data, daemon=True).start()
+
+        # 已下载Vosk模型时也在后台预先加载，切换引擎和第一次监听时无需等待
+        vosk_model_path = os.path.join("models", "vosk-model-small-cn-0.22")
+        if VOSK_AVAILABLE and os.path.exists(vosk_model_path):
+            threading.Thread(target=self._preload_vosk_model, args=(vosk_model_path, False), daemon=True).start()
 
         # 创建界面
         self.create_ui()
 
+        # 主线程定时显示后台线程的状态消息
+        self.root.after(100, self._drain_status_queue)
+
         # 在界面创建完成后初始化标签
         self.load_tags()  # This will load saved tags or initialize defaults
         self.create_tag_frame()
 
+        # 关闭窗口前写入尚未保存的标签
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+
         # 显示欢迎信息
-        self.content_text.config(state=tk.NORMAL)
-        self.content_text.delete(1.0, tk.END)
         welcome_text = """
 # 欢迎使用知识库语音导航系统
 
@@ -240,8 +623,12 @@ class KnowledgeNavigator:
 
 请开始使用吧！
 """
-        self.content_text.insert(tk.END, welcome_text)
-        self.content_text.config(state=tk.DISABLED)
+        with self._editable():
+            self.content_text.delete(1.0, tk.END)
+            self.content_text.insert(tk.END, welcome_text)
+        self._rendered_text = None
+        self._last_line = None
+        self._ctx_cache.clear()
 
         # 在其他初始化代码旁边添加
         self.ac_listbox = None
@@ -257,6 +644,9 @@ class KnowledgeNavigator:
         """显示启动选项屏幕"""
         self.content_text.config(state=tk.NORMAL)
         self.content_text.delete(1.0, tk.END)
+        self._rendered_text = None
+        self._last_line = None
+        self._ctx_cache.clear()
 
         # 显示标题
         self.content_text.insert(tk.END, "欢迎使用知识库语音导航系统\n\n", "startup_title")
@@ -337,29 +727,32 @@ class KnowledgeNavigator:
 
     def on_window_resize(self, event):
         # 只有当窗口宽度变化时才重新布局标签
-        # 避免窗口高度变化也触发重绘
-        if hasattr(self, 'last_width') and self.last_width != self.root.winfo_width():
-            total_width = self.root.winfo_width() - 40  # 减去边距
-            self.main_paned.paneconfigure(self.match_frame, width=int(total_width * 0.16))
-            self.main_paned.paneconfigure(self.content_frame, width=int(total_width * 0.5))
-            self.main_paned.paneconfigure(self.toc_frame, width=int(total_width * 0.34))
-
-            self.create_tag_frame()
-            # 更新标签统计数据
-            if self.knowledge_base:
-                self.update_tag_counts()
+        # 避免窗口高度变化也触发重绘；拖动窗口时连续的变化只在停下150毫秒后布局一次
+        width = self.root.winfo_width()
+        if hasattr(self, 'last_width') and self.last_width != width:
+            if self._resize_job:
+                self.root.after_cancel(self._resize_job)
+            self._resize_job = self.root.after(150, self._relayout_for_width)
 
-        self.last_width = self.root.winfo_width()
+        self.last_width = width
 
         # 更新分隔条指示器的位置
         if hasattr(self, 'sash_indicators'):
             self.update_sash_indicators()
 
+    def _relayout_for_width(self):
+        """按当前窗口宽度重新分配各面板宽度并排列标签"""
+        self._resize_job = None
+        total_width = self.root.winfo_width() - 40  # 减去边距
+        self.main_paned.paneconfigure(self.match_frame, width=int(total_width * 0.16))
+        self.main_paned.paneconfigure(self.content_frame, width=int(total_width * 0.5))
+        self.main_paned.paneconfigure(self.toc_frame, width=int(total_width * 0.34))
+
+        # 只重新排列已有的标签按钮，计数保持不变
+        self._layout_tags()
+
     def show_welcome_page(self):
         """显示欢迎页面"""
-        self.content_text.config(state=tk.NORMAL)
-        self.content_text.delete(1.0, tk.END)
-
         welcome_text = """
 # 欢迎使用知识库语音导航系统
 
@@ -377,8 +770,12 @@ class KnowledgeNavigator:
 
 请开始使用吧！
 """
-        self.content_text.insert(tk.END, welcome_text)
-        self.content_text.config(state=tk.DISABLED)
+        with self._editable():
+            self.content_text.delete(1.0, tk.END)
+            self.content_text.insert(tk.END, welcome_text)
+        self._rendered_text = None
+        self._last_line = None
+        self._ctx_cache.clear()
 
     def show_recent_files_dialog(self):
         """显示最近文件列表对话框"""
@@ -518,10 +915,13 @@ class KnowledgeNavigator:
             self.recent_files = []
 
     def save_recent_files(self):
-        """保存最近文件列表"""
+        """保存最近文件列表，和标签一样先写临时文件再替换"""
         try:
-            with open(self.recent_files_path, 'w', encoding='utf-8') as f:
+            recent_dir = os.path.dirname(os.path.abspath(self.recent_files_path))
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=recent_dir,
+                                             suffix='.tmp', delete=False) as f:
                 json.dump(self.recent_files, f, ensure_ascii=False, indent=2)
+            os.replace(f.name, self.recent_files_path)
         except Exception as e:
             print(f"保存最近文件列表失败: {str(e)}")
 
@@ -567,26 +967,12 @@ class KnowledgeNavigator:
             return
 
         try:
-            # 先尝试用UTF-8打开
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    self.knowledge_base = file.read()
-            except UnicodeDecodeError:
-                # 如果失败，尝试用GBK打开
-                with open(file_path, 'r', encoding='gbk') as file:
-                    self.knowledge_base = file.read()
-
-            self.knowledge_path = file_path
+            # 读取并解析知识库，构建目录
+            self._load_knowledge_file(file_path)
 
             # 更新最近文件列表
             self.add_to_recent_files(file_path)
 
-            # 解析知识库
-            self.parse_knowledge_base()
-
-            # 构建目录
-            self.build_toc()
-
             # 显示内容
             self.display_knowledge_base()
 
@@ -677,6 +1063,13 @@ class KnowledgeNavigator:
                                         value="Sphinx",
                                         command=self.change_speech_engine)
 
+        # 如果Google Cloud Speech可用，添加流式识别选项
+        if GCLOUD_SPEECH_AVAILABLE:
+            self.voice_menu.add_radiobutton(label="Google Cloud (在线流式，延迟低)",
+                                            variable=self.engine_var,
+                                            value="GoogleCloud",
+                                            command=self.change_speech_engine)
+
         # 如果Vosk可用，添加Vosk选项
         if VOSK_AVAILABLE:
             self.voice_menu.add_radiobutton(label="Vosk (离线，中文支持好)",
@@ -790,6 +1183,10 @@ class KnowledgeNavigator:
         self.root.option_add('*Panedwindow.sashRelief', 'raised')  # 凸起的视觉效果
         self.root.option_add('*Panedwindow.sashBorderWidth', 1)  # 边框宽度
 
+        # 标签按钮的固定外观
+        for pattern, value in _TAG_CHIP_OPTIONS.items():
+            self.root.option_add(pattern, value)
+
         # 左侧：匹配结果列表和控制
         self.match_frame = tk.Frame(self.main_paned, width=300)
         self.match_frame.pack_propagate(False)  # 防止frame被内容撑开
@@ -880,6 +1277,7 @@ class KnowledgeNavigator:
         toc_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.toc_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.toc_tree.bind("<<TreeviewSelect>>", self.on_toc_select)
+        self.toc_tree.bind("<<TreeviewOpen>>", self.on_toc_open)
 
         self.main_paned.add(self.toc_frame)
 
@@ -904,13 +1302,16 @@ class KnowledgeNavigator:
 
         # 存储字体大小
         self.current_font_size = 11
+        self._configure_font_tags()
+
+        # 定位高亮的各行颜色固定，只需配置一次
+        for tag, color in _POSITION_HIGHLIGHT_TAGS.items():
+            self.content_text.tag_config(tag, background=color)
 
-        # 快捷键
-        self.root.bind("<Alt-1>", lambda e: self.search_tag(self.tags[0]) if len(self.tags) > 0 else None)
-        self.root.bind("<Alt-2>", lambda e: self.search_tag(self.tags[1]) if len(self.tags) > 1 else None)
-        self.root.bind("<Alt-3>", lambda e: self.search_tag(self.tags[2]) if len(self.tags) > 2 else None)
-        self.root.bind("<Alt-4>", lambda e: self.search_tag(self.tags[3]) if len(self.tags) > 3 else None)
-        self.root.bind("<Alt-5>", lambda e: self.search_tag(self.tags[4]) if len(self.tags) > 4 else None)
+        # 快捷键 Alt-1 ~ Alt-5 对应前五个标签
+        for i in range(5):
+            self.root.bind(f"<Alt-{i + 1}>",
+                           lambda e, idx=i: self.search_tag(self.tags[idx]) if idx < len(self.tags) else None)
     # 3. 添加鼠标悬停效果，在sash上显示手型光标
 
     def on_enter_sash(self, event):
@@ -1052,9 +1453,8 @@ class KnowledgeNavigator:
             except tk.TclError:
                 pass
 
-        # 创建主框架
+        # 创建主框架，内容全部建好后再显示，只需一次整体布局
         tag_main_frame = tk.Frame(self.root)
-        tag_main_frame.pack(fill=tk.X, padx=10, pady=(0, 5))
 
         # 创建标题和添加按钮的行
         header_frame = tk.Frame(tag_main_frame)
@@ -1083,69 +1483,73 @@ class KnowledgeNavigator:
 
         # 清除旧的标签按钮列表
         self.tag_buttons = []
+        self._tag_rows = []
+        self._tag_count_shown.clear()
 
-        # 固定每行显示的标签数
-        tags_per_row = 10  # 可以调整这个值来改变每行标签数量
-
-        # 配置每行最大宽度和标签处理
-        max_width = self.root.winfo_width() - 10  # 留出边距
-        # tags_per_row = max(3, min(8, max_width // 120))  # 根据窗口宽度计算每行标签数
-
-        # 为标签创建多行
+        # 创建标签按钮，再按窗口宽度排成多行
         if hasattr(self, 'tags') and self.tags:
-            current_row = tk.Frame(self.tag_frame)
-            current_row.pack(fill=tk.X, pady=2)
+            for tag in self.tags:
+                self.create_tag_button(tag)
+        self._layout_tags()
 
-            row_count = 0
-            current_width = 0
+        tag_main_frame.pack(fill=tk.X, padx=10, pady=(0, 5))
+        self.tag_frame_main = tag_main_frame
 
-            for index, tag in enumerate(self.tags):
-                # 预估标签宽度 (每个字符约8像素，再加上额外的padding和按钮)
-                tag_width = len(tag) * 8 + 50
+    def _layout_tags(self):
+        """把已有的标签按钮按当前窗口宽度排成多行，只重新pack，不重建标签控件"""
+        # 旧的行框架销毁后，其中的标签按钮自动解除布局
+        for row in self._tag_rows:
+            row.destroy()
+        self._tag_rows = []
 
-                # 如果这个标签会导致当前行超过最大宽度或达到每行最大标签数，创建新行
-                if row_count >= tags_per_row or current_width + tag_width > max_width:
-                    current_row = tk.Frame(self.tag_frame)
-                    current_row.pack(fill=tk.X, pady=2)
-                    row_count = 0
-                    current_width = 0
+        # 固定每行显示的标签数
+        tags_per_row = 10  # 可以调整这个值来改变每行标签数量
 
-                # 在当前行创建标签
-                tag_button_info = self.create_tag_button(tag, parent=current_row)
-                # 更新当前行计数和宽度估计
-                row_count += 1
-                current_width += tag_width
+        # 配置每行最大宽度
+        max_width = self.root.winfo_width() - 10  # 留出边距
 
-        self.tag_frame_main = tag_main_frame
+        current_row = None
+        row_count = 0
+        current_width = 0
+        for tag_info in self.tag_buttons:
+            # 预估标签宽度 (每个字符约8像素，再加上额外的padding和按钮)
+            tag_width = len(tag_info[4]) * 8 + 50
+
+            # 如果这个标签会导致当前行超过最大宽度或达到每行最大标签数，创建新行
+            if current_row is None or row_count >= tags_per_row or current_width + tag_width > max_width:
+                current_row = tk.Frame(self.tag_frame)
+                current_row.pack(fill=tk.X, pady=2)
+                # 行框架比标签按钮后创建，放到最底层以免遮住按钮
+                current_row.lower()
+                self._tag_rows.append(current_row)
+                row_count = 0
+                current_width = 0
+
+            # 标签按钮是tag_frame的子控件，可以放进任意一行
+            tag_info[0].pack(in_=current_row, side=tk.LEFT, padx=3, pady=3)
+            row_count += 1
+            current_width += tag_width
 
     def create_tag_button(self, tag_text, parent=None):
-        """创建标签按钮，支持指定父容器"""
+        """创建标签按钮，支持指定父容器；放在默认的tag_frame中时由_layout_tags排列"""
         # 如果没有指定父容器，默认使用self.tag_frame
         if parent is None:
             parent = self.tag_frame
 
-        # 生成一个基于标签文本的柔和背景色
-        color_seed = hash(tag_text) % 1000
-        r = min(230, max(180, (color_seed % 5) * 10 + 180))
-        g = min(240, max(200, ((color_seed // 5) % 5) * 10 + 200))
-        b = min(250, max(220, ((color_seed // 25) % 5) * 10 + 220))
-        bg_color = f"#{r:02x}{g:02x}{b:02x}"
+        # 基于标签文本的柔和背景色
+        bg_color = _tag_color(tag_text)
 
-        # 创建标签容器
-        tag_container = tk.Frame(parent, bd=1, relief=tk.RAISED, bg=bg_color)
-        tag_container.pack(side=tk.LEFT, padx=3, pady=3)
+        # 创建标签容器，边框、字体等固定外观来自选项数据库(_TAG_CHIP_OPTIONS)
+        tag_container = tk.Frame(parent, class_='TagChip', bg=bg_color)
+        if parent is not self.tag_frame:
+            tag_container.pack(side=tk.LEFT, padx=3, pady=3)
 
         # 创建标签按钮
         tag_button = tk.Button(
             tag_container,
+            name='tag',
             text=tag_text,
-            font=("Arial", 12),
-            padx=1,
-            pady=1,
-            relief=tk.FLAT,
             bg=bg_color,
-            activebackground="#d0d0d0",
-            cursor="hand2",
             command=lambda t=tag_text: self.search_tag(t)
         )
         tag_button.pack(side=tk.LEFT)
@@ -1153,28 +1557,18 @@ class KnowledgeNavigator:
         # 添加标签计数显示
         count_label = tk.Label(
             tag_container,
+            name='count',
             text="0",  # 初始计数为0，将在搜索时更新
-            font=("Arial", 8),
-            bg=bg_color,
-            fg="#555555",
-            width=2,
-            padx=0
+            bg=bg_color
         )
         count_label.pack(side=tk.LEFT, padx=(0, 2))
 
         # 创建小型关闭按钮
         close_button = tk.Button(
             tag_container,
+            name='close',
             text="×",
-            font=("Arial", 8, "bold"),
-            width=1,
-            height=1,
-            padx=0,
-            pady=0,
-            relief=tk.FLAT,
             bg=bg_color,
-            activebackground="#ff9999",
-            cursor="hand2",
             command=lambda t=tag_text: self.delete_tag(t)
         )
         close_button.pack(side=tk.RIGHT)
@@ -1215,9 +1609,17 @@ class KnowledgeNavigator:
         # 保存成元组格式，包含计数标签
         tag_info = (tag_container, tag_button, close_button, count_label, tag_text)
         self.tag_buttons.append(tag_info)
+        self._tag_count_shown.pop(tag_text, None)
 
         return tag_info
 
+    def _find_tag_button(self, tag_text):
+        """返回标签按钮在tag_buttons中的下标，没有则返回-1"""
+        for i, tag_info in enumerate(self.tag_buttons):
+            if tag_info[4] == tag_text:
+                return i
+        return -1
+
     # 创建匹配项图标
     def _create_match_icons(self):
         """创建用于匹配结果的图标"""
@@ -1236,8 +1638,7 @@ class KnowledgeNavigator:
         self.last_search_query = query
 
         # 清空匹配列表
-        for item in self.match_list.get_children():
-            self.match_list.delete(item)
+        self.match_list.delete(*self.match_list.get_children())
 
         if not query or not self.knowledge_base:
             return
@@ -1373,15 +1774,10 @@ class KnowledgeNavigator:
     # 查找匹配项所属的一级章节
     def _find_parent_chapter(self, position):
         """查找指定位置属于哪个一级章节"""
-        parent_chapter = "未知章节"
-
-        for heading in self.heading_positions:
-            if heading['position'] > position:
-                break
-            if heading.get('level', 0) == 1:
-                parent_chapter = heading['text']
-
-        return parent_chapter
+        i = bisect.bisect_right(self._h_positions, position)
+        if i == 0:
+            return "未知章节"
+        return self._h_chapters[i - 1]
 
     # 排序匹配结果
     def _sort_matches(self, matches):
@@ -1402,10 +1798,8 @@ class KnowledgeNavigator:
             def get_level(match):
                 if match['type'] == 'heading':
                     # 直接使用标题级别
-                    for h in self.heading_positions:
-                        if h['position'] == match['position']:
-                            return h.get('level', 99)
-                    return 99
+                    h = self._heading_index_at(match['position'])
+                    return self._h_levels[h] if h >= 0 else 99
                 else:
                     # 内容匹配使用最近标题的级别
                     nearest_heading = self._find_nearest_heading(match['position'])
@@ -1425,8 +1819,7 @@ class KnowledgeNavigator:
         self.last_matches = matches.copy()
 
         # 清空匹配列表
-        for item in self.match_list.get_children():
-            self.match_list.delete(item)
+        self.match_list.delete(*self.match_list.get_children())
 
         if not matches:
             return
@@ -1451,11 +1844,8 @@ class KnowledgeNavigator:
                 relevance = min(100, int(match['score'] * 20))
 
                 # 获取标题级别用于缩进
-                level = 1
-                for h in self.heading_positions:
-                    if h['position'] == match['position']:
-                        level = h.get('level', 1)
-                        break
+                h = self._heading_index_at(match['position'])
+                level = self._h_levels[h] if h >= 0 else 1
 
                 # 创建缩进字符串
                 indent = "  " * (level - 1) if level > 1 else ""
@@ -1813,7 +2203,8 @@ class KnowledgeNavigator:
 
         # 强制重置之前的高亮，确保每次点击都能高亮
         self.content_text.config(state=tk.NORMAL)
-        self.content_text.tag_remove("position_highlight", "1.0", tk.END)
+        for tag in _POSITION_HIGHLIGHT_TAGS:
+            self.content_text.tag_remove(tag, "1.0", tk.END)
 
         if is_markdown:
             # 多种匹配策略
@@ -1835,24 +2226,7 @@ class KnowledgeNavigator:
 
                         # 高亮该标题行及其下方几行
                         line_num = int(start_pos.split('.')[0])
-                        for i in range(0, 5):  # 当前行和后4行
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"  # 当前行亮黄色
-                                    else:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting heading: {e}")
-                                    pass
+                        self._highlight_lines(line_num, before=0, after=4)
 
                         # 高亮目录中的相应项目
                         self.highlight_toc_for_position(position)
@@ -1891,26 +2265,7 @@ class KnowledgeNavigator:
 
                         # 高亮当前行和周围几行
                         line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):  # 前1行和后4行
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"  # 当前行亮黄色
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"  # 前一行浅黄色
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting keyword match: {e}")
-                                    pass
+                        self._highlight_lines(line_num)
 
                         matched = True
                         break
@@ -1927,26 +2282,7 @@ class KnowledgeNavigator:
 
                         # 高亮当前行和周围几行
                         line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting title part: {e}")
-                                    pass
+                        self._highlight_lines(line_num)
 
                         matched = True
 
@@ -1987,26 +2323,7 @@ class KnowledgeNavigator:
 
                         # 高亮当前行和周围几行
                         line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting term: {e}")
-                                    pass
+                        self._highlight_lines(line_num)
 
                         matched = True
                         break
@@ -2016,7 +2333,7 @@ class KnowledgeNavigator:
                 print("All matching strategies failed, trying direct position scroll")
 
                 # 直接使用原始位置跳转
-                line_number = self.knowledge_base.count('\n', 0, position) + 1
+                line_number = self._line_col(position)[0]
                 mark_position = f"{line_number}.0"
 
                 # 尝试计算一个更精确的位置
@@ -2039,25 +2356,7 @@ class KnowledgeNavigator:
 
                 # 高亮当前行和周围几行
                 line_num = int(mark_position.split('.')[0])
-                for i in range(-2, 6):  # 增加高亮范围: 前2行和后5行
-                    curr_line = line_num + i
-                    if curr_line > 0:
-                        line_start = f"{curr_line}.0"
-                        try:
-                            line_end = f"{curr_line}.end"
-
-                            if i == 0:
-                                highlight_color = "yellow"  # 当前行亮黄色
-                            elif i > 0:
-                                intensity = max(204, 255 - (i * 10))
-                                highlight_color = f"#FFFF{intensity:02X}"
-                            else:
-                                highlight_color = "#FFFFDD"  # 前面的行浅黄色
-
-                            self.content_text.tag_add("position_highlight", line_start, line_end)
-                            self.content_text.tag_config("position_highlight", background=highlight_color)
-                        except Exception as e:
-                            print(f"Error highlighting line {curr_line}: {e}")
+                self._highlight_lines(line_num, before=2, after=5)
 
                 # 如果这是一个标题，同时高亮目录中的相应项目
                 if match_type == 'heading':
@@ -2163,7 +2462,8 @@ class KnowledgeNavigator:
 
         # 强制重置之前的高亮，确保每次点击都能高亮
         self.content_text.config(state=tk.NORMAL)
-        self.content_text.tag_remove("position_highlight", "1.0", tk.END)
+        for tag in _POSITION_HIGHLIGHT_TAGS:
+            self.content_text.tag_remove(tag, "1.0", tk.END)
 
         if is_markdown:
             # 多种匹配策略
@@ -2185,24 +2485,7 @@ class KnowledgeNavigator:
 
                         # 高亮该标题行及其下方几行
                         line_num = int(start_pos.split('.')[0])
-                        for i in range(0, 5):  # 当前行和后4行
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"  # 当前行亮黄色
-                                    else:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting heading: {e}")
-                                    pass
+                        self._highlight_lines(line_num, before=0, after=4)
 
                         # 高亮目录中的相应项目
                         self.highlight_toc_for_position(position)
@@ -2241,26 +2524,7 @@ class KnowledgeNavigator:
 
                         # 高亮当前行和周围几行
                         line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):  # 前1行和后4行
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"  # 当前行亮黄色
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"  # 前一行浅黄色
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting keyword match: {e}")
-                                    pass
+                        self._highlight_lines(line_num)
 
                         matched = True
                         break
@@ -2277,26 +2541,7 @@ class KnowledgeNavigator:
 
                         # 高亮当前行和周围几行
                         line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting title part: {e}")
-                                    pass
+                        self._highlight_lines(line_num)
 
                         matched = True
 
@@ -2337,26 +2582,7 @@ class KnowledgeNavigator:
 
                         # 高亮当前行和周围几行
                         line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except Exception as e:
-                                    print(f"Error highlighting term: {e}")
-                                    pass
+                        self._highlight_lines(line_num)
 
                         matched = True
                         break
@@ -2366,7 +2592,7 @@ class KnowledgeNavigator:
                 print("All matching strategies failed, trying direct position scroll")
 
                 # 直接使用原始位置跳转
-                line_number = self.knowledge_base.count('\n', 0, position) + 1
+                line_number = self._line_col(position)[0]
                 mark_position = f"{line_number}.0"
 
                 # 尝试计算一个更精确的位置
@@ -2389,25 +2615,7 @@ class KnowledgeNavigator:
 
                 # 高亮当前行和周围几行
                 line_num = int(mark_position.split('.')[0])
-                for i in range(-2, 6):  # 增加高亮范围: 前2行和后5行
-                    curr_line = line_num + i
-                    if curr_line > 0:
-                        line_start = f"{curr_line}.0"
-                        try:
-                            line_end = f"{curr_line}.end"
-
-                            if i == 0:
-                                highlight_color = "yellow"  # 当前行亮黄色
-                            elif i > 0:
-                                intensity = max(204, 255 - (i * 10))
-                                highlight_color = f"#FFFF{intensity:02X}"
-                            else:
-                                highlight_color = "#FFFFDD"  # 前面的行浅黄色
-
-                            self.content_text.tag_add("position_highlight", line_start, line_end)
-                            self.content_text.tag_config("position_highlight", background=highlight_color)
-                        except Exception as e:
-                            print(f"Error highlighting line {curr_line}: {e}")
+                self._highlight_lines(line_num, before=2, after=5)
 
                 # 如果这是一个标题，同时高亮目录中的相应项目
                 if match_type == 'heading':
@@ -2479,6 +2687,8 @@ class KnowledgeNavigator:
             if tag and tag not in self.tags:
                 self.tags.append(tag)
                 self.create_tag_button(tag)
+                self._layout_tags()
+                self.update_tag_counts()
                 self.save_tags()
                 dialog.destroy()
             elif not tag:
@@ -2553,9 +2763,8 @@ class KnowledgeNavigator:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tag_listbox.config(yscrollcommand=scrollbar.set)
 
-        # 填充标签列表
-        for tag in self.tags:
-            tag_listbox.insert(tk.END, tag)
+        # 填充标签列表，一次插入全部标签
+        tag_listbox.insert(tk.END, *self.tags)
 
         # 创建按钮框架
         button_frame = tk.Frame(list_frame)
@@ -2828,9 +3037,9 @@ class KnowledgeNavigator:
                     new_tags = new_tags[:len(new_tags) - overflow]
 
                 # 添加新标签
-                for tag in new_tags:
-                    self.tags.append(tag)
-                    tag_listbox.insert(tk.END, tag)
+                self.tags.extend(new_tags)
+                if new_tags:
+                    tag_listbox.insert(tk.END, *new_tags)
 
                 # 保存并更新
                 self.save_tags()
@@ -2856,8 +3065,7 @@ class KnowledgeNavigator:
 
             try:
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    for tag in self.tags:
-                        f.write(f"{tag}\n")
+                    f.write(''.join(f"{tag}\n" for tag in self.tags))
 
                 self.messagebox.showinfo("成功", f"已成功导出{len(self.tags)}个标签到文件")
 
@@ -2900,7 +3108,14 @@ class KnowledgeNavigator:
         self.status_bar.config(text=f"已复制 '{text}' 到剪贴板")
 
     def update_tag_counts(self):
-        """更新标签上显示的匹配计数 - 修复版本"""
+        """更新标签上显示的匹配计数 - 延迟20ms执行，连续多次调用只计算一次"""
+        if not self._tag_count_job:
+            self._tag_count_job = self.root.after(20, self._update_tag_counts_now)
+
+    def _update_tag_counts_now(self):
+        """立即更新标签上显示的匹配计数"""
+        self._tag_count_job = None
+
         # 如果没有加载知识库，不需要更新
         if not self.knowledge_base:
             return
@@ -2910,32 +3125,30 @@ class KnowledgeNavigator:
             # 从元组中提取各个组件 - 兼容修复后的结构
             tag_container, tag_button, close_button, count_label, tag_text = tag_info
 
-            # 提取关键词
-            keywords = self.extract_keywords(tag_text)
-
-            # 计算匹配数
-            match_count = 0
-
-            # 在标题中搜索
-            for heading in self.heading_positions:
-                heading_text = heading['text'].lower()
-
-                for keyword in keywords:
-                    if keyword.lower() in heading_text:
-                        match_count += 1
-                        break  # 每个标题只计数一次
+            match_count = self._tag_match_count(tag_text)
 
-            # 如果匹配数超过0，更新计数标签
-            count_label.config(text=str(match_count) if match_count <= 99 else "99+")
+            # 更新计数标签，颜色反映匹配数量，一次config完成；显示没有变化时跳过
+            text = str(match_count) if match_count <= 99 else "99+"
+            fg = "#999999" if match_count == 0 else "#555555" if match_count < 5 else "#0066CC"
+            if self._tag_count_shown.get(tag_text) == (text, fg):
+                continue
+            self._tag_count_shown[tag_text] = (text, fg)
+            count_label.config(text=text, fg=fg, font=("Arial", 8, "bold") if match_count >= 5 else ("Arial", 8))
+
+    def _tag_match_count(self, tag_text):
+        """标签在标题中的匹配数，每个标题只计数一次；结果按知识库版本缓存"""
+        if self._tag_counts_version != self._kb_version:
+            self._tag_counts.clear()
+            self._tag_counts_version = self._kb_version
+
+        count = self._tag_counts.get(tag_text)
+        if count is None:
+            matched = set()
+            for keyword in self.extract_keywords(tag_text):
+                matched.update(self._headings_containing(keyword.lower()))
+            count = self._tag_counts[tag_text] = len(matched)
+        return count
 
-            # 颜色反映匹配数量
-            if match_count == 0:
-                count_label.config(fg="#999999")
-            elif match_count < 5:
-                count_label.config(fg="#555555")
-            else:
-                count_label.config(fg="#0066CC", font=("Arial", 8, "bold"))
-                
     def edit_tag(self, old_tag):
         """Show a dialog to edit a tag"""
         dialog = tk.Toplevel(self.root)
@@ -2961,8 +3174,17 @@ class KnowledgeNavigator:
                 index = self.tags.index(old_tag)
                 self.tags[index] = new_tag
 
-                # Recreate tag buttons
-                self.create_tag_frame()
+                # 只重建这一个标签（颜色由文本决定），不重建整个标签栏
+                i = self._find_tag_button(old_tag)
+                if i >= 0:
+                    self.tag_buttons.pop(i)[0].destroy()
+                    self._tag_count_shown.pop(old_tag, None)
+                    self.create_tag_button(new_tag)
+                    self.tag_buttons.insert(i, self.tag_buttons.pop())
+                    self._layout_tags()
+                else:
+                    self.create_tag_frame()
+                self.update_tag_counts()
 
                 # Save tags
                 self.save_tags()
@@ -2986,30 +3208,61 @@ class KnowledgeNavigator:
             result = messagebox.askyesno("确认", f"确定要删除标签 '{tag}' 吗?", parent=self.root)
             if result:  # 确认删除
                 self.tags.remove(tag)
-                self.create_tag_frame()  # 重建标签框架
+
+                # 只移除对应的标签按钮，不重建整个标签栏
+                i = self._find_tag_button(tag)
+                if i >= 0:
+                    self.tag_buttons.pop(i)[0].destroy()
+                    self._tag_count_shown.pop(tag, None)
+                    self._layout_tags()
+                else:
+                    self.create_tag_frame()
                 self.save_tags()  # 保存标签状态
                 self.status_bar.config(text=f"已删除标签: {tag}")
 
     def save_tags(self):
-        """Save tags to a file"""
+        """Save tags to a file (debounced, written 500ms after the last change)"""
         if self.knowledge_path:
             # Use same base name as knowledge file with .tags extension
             base_name = os.path.splitext(self.knowledge_path)[0]
-            tags_file = f"{base_name}.tags"
+            self._pending_tags_file = f"{base_name}.tags"
         else:
             # If no knowledge base loaded, use default
-            tags_file = "default.tags"
+            self._pending_tags_file = "default.tags"
+
+        # 连续修改时只在最后一次修改后写一次文件
+        if self._save_tags_after_id:
+            self.root.after_cancel(self._save_tags_after_id)
+        self._save_tags_after_id = self.root.after(500, self._save_tags_now)
+
+    def flush_tags(self):
+        """立即写入尚未保存的标签"""
+        if self._save_tags_after_id:
+            self.root.after_cancel(self._save_tags_after_id)
+            self._save_tags_now()
+
+    def _save_tags_now(self):
+        """把标签写入文件，先写临时文件再替换，避免写到一半的文件"""
+        self._save_tags_after_id = None
+        tags_file = self._pending_tags_file
+        if not tags_file:
+            return
 
         try:
-            with open(tags_file, 'w', encoding='utf-8') as f:
-                for tag in self.tags:
-                    f.write(f"{tag}\n")
+            tags_dir = os.path.dirname(os.path.abspath(tags_file))
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=tags_dir,
+                                             suffix='.tmp', delete=False) as f:
+                f.write(''.join(f"{tag}\n" for tag in self.tags))
+            os.replace(f.name, tags_file)
         except Exception as e:
             print(f"保存标签失败: {str(e)}")
             self.status_bar.config(text=f"保存标签失败: {str(e)}")
 
     def load_tags(self):
         """Load tags from a file"""
+        # 切换知识库前先保存上一个知识库的标签
+        self.flush_tags()
+
         if self.knowledge_path:
             # Use same base name as knowledge file with .tags extension
             base_name = os.path.splitext(self.knowledge_path)[0]
@@ -3024,10 +3277,7 @@ class KnowledgeNavigator:
         try:
             if os.path.exists(tags_file):
                 with open(tags_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        tag = line.strip()
-                        if tag:
-                            self.tags.append(tag)
+                    self.tags = [tag for tag in map(str.strip, f.read().splitlines()) if tag]
                     if self.tags:
                         tags_loaded = True
         except Exception as e:
@@ -3038,6 +3288,16 @@ class KnowledgeNavigator:
         if not tags_loaded:
             self.initialize_default_tags()
 
+    def on_closing(self):
+        """关闭窗口"""
+        self.flush_tags()
+        self._closing = True
+        # shutdown的cancel_futures参数需要Python 3.9，这里自己取消排队中的搜索
+        if self._search_future:
+            self._search_future.cancel()
+        self._search_exec.shutdown(wait=False)
+        self.root.destroy()
+
     def open_knowledge_base(self):
         """打开知识库文件"""
         file_path = filedialog.askopenfilename(
@@ -3047,26 +3307,12 @@ class KnowledgeNavigator:
 
         if file_path:
             try:
-                # 先尝试用UTF-8打开
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        self.knowledge_base = file.read()
-                except UnicodeDecodeError:
-                    # 如果失败，尝试用GBK打开
-                    with open(file_path, 'r', encoding='gbk') as file:
-                        self.knowledge_base = file.read()
-
-                self.knowledge_path = file_path
+                # 读取并解析知识库，构建目录
+                self._load_knowledge_file(file_path)
 
                 # 添加到最近文件列表
                 self.add_to_recent_files(file_path)
 
-                # 解析知识库
-                self.parse_knowledge_base()
-
-                # 构建目录
-                self.build_toc()
-
                 # 显示内容
                 self.display_knowledge_base()
 
@@ -3104,13 +3350,10 @@ class KnowledgeNavigator:
             return
 
         try:
-            # 重新加载文件
-            with open(self.knowledge_path, 'r', encoding='utf-8') as file:
-                self.knowledge_base = file.read()
+            # 重新加载文件（未修改时复用解析缓存）
+            self._load_knowledge_file(self.knowledge_path)
 
             # 刷新显示
-            self.parse_knowledge_base()
-            self.build_toc()
             self.display_knowledge_base()
 
             # 更新状态
@@ -3129,45 +3372,65 @@ class KnowledgeNavigator:
 
 
 
+    def _load_knowledge_file(self, file_path):
+        """读取并解析知识库文件，文件未修改时直接复用缓存的解析结果"""
+        key = (file_path, os.path.getmtime(file_path), os.path.getsize(file_path))
+
+        cached = self._parse_cache.get(key)
+        if cached is not None:
+            # 文件未变化，跳过读取和解析
+            self._parse_cache.move_to_end(key)
+            self.knowledge_base, self.heading_positions = cached
+            self.knowledge_path = file_path
+            self._index_headings()
+            self._kb_version += 1
+        else:
+            # 先尝试用UTF-8打开
+            try:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    self.knowledge_base = file.read()
+            except UnicodeDecodeError:
+                # 如果失败，尝试用GBK打开
+                with open(file_path, 'r', encoding='gbk') as file:
+                    self.knowledge_base = file.read()
+
+            self.knowledge_path = file_path
+
+            # 解析知识库
+            self.parse_knowledge_base()
+
+            # 缓存解析结果，只保留最近的几个文件
+            self._parse_cache[key] = (self.knowledge_base, self.heading_positions)
+            if len(self._parse_cache) > self.max_parse_cache:
+                self._parse_cache.popitem(last=False)
+
+        # 目录树已经是该文件的内容时不必重建
+        if self._toc_key != key:
+            self.build_toc()
+            self._toc_key = key
+
     def parse_knowledge_base(self):
         """解析知识库，识别标题和内容结构"""
         self.heading_positions = []
+        self._kb_version += 1
 
         # 判断文件类型
         is_markdown = self.knowledge_path and self.knowledge_path.lower().endswith('.md')
 
         if is_markdown:
-            # Markdown标题模式
-            heading_pattern = re.compile(r'^(#{1,6}\s+.+)$', re.MULTILINE)
-
-            for match in heading_pattern.finditer(self.knowledge_base):
-                start_pos = match.start()
-                heading_text = match.group().strip()
-
-                # 清理Markdown标记
-                clean_heading = re.sub(r'^#+\s+', '', heading_text)
-                # 获取标题级别
-                level = len(re.match(r'^#+', heading_text).group())
-
-                # 存储上下文内容，用于更精确匹配
-                context_start = max(0, start_pos - 50)
-                context_end = min(len(self.knowledge_base), start_pos + len(heading_text) + 50)
-                context = self.knowledge_base[context_start:context_end]
-
-                self.heading_positions.append({
-                    'text': clean_heading,
-                    'position': start_pos,
-                    'raw': heading_text,
-                    'level': level,
-                    'context': context,  # 添加上下文内容
-                    'rendered_position': None  # 将在显示时更新
-                })
+            # Markdown标题模式，井号和标题文字分组捕获，不必再逐个清理；一次扫描得到的标题已按位置排列
+            self.heading_positions = [{
+                'text': match.group(2).strip(),
+                'position': match.start(),
+                'raw': match.group().strip(),
+                'level': len(match.group(1)),
+                'rendered_position': None  # 将在显示时更新
+            } for match in _MD_HEADING_RE.finditer(self.knowledge_base)]
         else:
             # 文本文件标题识别 (多种格式)
 
             # 方式1: 下划线式标题 (如 "标题\n====" 或 "标题\n----")
-            underline_pattern = re.compile(r'^(.+)\n([=\-]{3,})$', re.MULTILINE)
-            for match in underline_pattern.finditer(self.knowledge_base):
+            for match in _UNDERLINE_HEADING_RE.finditer(self.knowledge_base):
                 heading_text = match.group(1).strip()
                 underline_char = match.group(2)[0]
                 level = 1 if underline_char == '=' else 2
@@ -3180,10 +3443,10 @@ class KnowledgeNavigator:
                 })
 
             # 方式2: 数字编号标题 (如 "1. 标题" 或 "1.1 标题")
-            number_pattern = re.compile(r'^(\d+\.)+\s+(.+)$', re.MULTILINE)
-            for match in number_pattern.finditer(self.knowledge_base):
+            for match in _NUMBER_HEADING_RE.finditer(self.knowledge_base):
                 heading_text = match.group()
-                level = len(re.findall(r'\d+\.', heading_text))
+                # 编号部分(分组1的最后一次重复之前)有几个点就是几级
+                level = heading_text.count('.', 0, match.end(1) - match.start())
 
                 self.heading_positions.append({
                     'text': heading_text,
@@ -3194,8 +3457,7 @@ class KnowledgeNavigator:
 
             # 方式3: 全大写行或特殊格式行
             if len(self.heading_positions) < 3:  # 如果找到的标题太少
-                line_pattern = re.compile(r'^([A-Z\s]{5,})$', re.MULTILINE)
-                for match in line_pattern.finditer(self.knowledge_base):
+                for match in _UPPER_LINE_RE.finditer(self.knowledge_base):
                     heading_text = match.group().strip()
 
                     self.heading_positions.append({
@@ -3205,8 +3467,80 @@ class KnowledgeNavigator:
                         'level': 1
                     })
 
-        # 按位置排序
-        self.heading_positions.sort(key=lambda x: x['position'])
+            # 多种格式分别扫描，合并后按位置排序
+            self.heading_positions.sort(key=lambda x: x['position'])
+
+        self._index_headings()
+
+    def _index_headings(self):
+        """按位置建立标题的并列数组，供二分查找使用"""
+        # 位置用紧凑的整数数组保存，比整数对象列表省内存，二分查找也更快
+        self._h_positions = array('q', (h['position'] for h in self.heading_positions))
+        self._h_texts = [h['text'] for h in self.heading_positions]
+        self._h_levels = array('B', (h.get('level', 1) for h in self.heading_positions))
+        self._h_normalized = [text.lower() for text in self._h_texts]
+
+        # 字符 -> 含有该字符的标题下标，精确匹配时只需检查最短的倒排表
+        self._h_char_index = {}
+        for i, text in enumerate(self._h_normalized):
+            for ch in set(text):
+                self._h_char_index.setdefault(ch, array('i')).append(i)
+
+        # 每个标题所属的一级章节（含自身）
+        self._h_chapters = []
+        chapter = "未知章节"
+        for text, level in zip(self._h_texts, self._h_levels):
+            if level == 1:
+                chapter = text
+            self._h_chapters.append(chapter)
+
+        # 把小写标题编码成一个连续数组，供JIT模糊匹配使用
+        codes = offsets = None
+        if NUMBA_AVAILABLE:
+            codes = np.frombuffer(''.join(self._h_normalized).encode('utf-32-le'), dtype=np.uint32)
+            offsets = np.zeros(len(self._h_normalized) + 1, dtype=np.int64)
+            np.cumsum([len(text) for text in self._h_normalized], out=offsets[1:])
+
+        # 后台搜索使用的快照，提交搜索时取出
+        self._h_index = _HeadingIndex(self.heading_positions, self._h_positions, self._h_normalized,
+                                      self._h_char_index, codes, offsets)
+
+    def _fuzzy_heading_ratios(self, keyword, cutoff, index=None):
+        """批量计算关键词与所有标题的相似度，没有可用的加速库时返回None"""
+        index = index or self._h_index
+        if not index.normalized:
+            return None
+        if RAPIDFUZZ_AVAILABLE:
+            return _fuzzy_ratios(keyword, index.normalized, cutoff)
+        if not NUMBA_AVAILABLE:
+            return None
+        query = np.frombuffer(keyword.encode('utf-32-le'), dtype=np.uint32)
+        return _ratio_batch(query, index.codes, index.offsets, cutoff)
+
+    def _headings_containing(self, keyword, index=None):
+        """返回小写标题中包含小写关键词keyword的标题下标，按位置排序"""
+        index = index or self._h_index
+        if not keyword:
+            return range(len(index.normalized))
+        shortest = min((index.char_index.get(ch, ()) for ch in set(keyword)), key=len)
+        return [i for i in shortest if keyword in index.normalized[i]]
+
+    def heading_at(self, char_pos, positions=None):
+        """返回包含该位置的标题下标（位置之前最近的标题），没有则返回-1"""
+        if positions is None:
+            positions = self._h_positions
+        i = bisect.bisect_right(positions, char_pos) - 1
+        if i > 0:
+            # 同一位置有多个标题时取第一个
+            i = bisect.bisect_left(positions, positions[i])
+        return i
+
+    def _heading_index_at(self, position):
+        """返回恰好位于该位置的标题下标，没有则返回-1"""
+        i = bisect.bisect_left(self._h_positions, position)
+        if i < len(self._h_positions) and self._h_positions[i] == position:
+            return i
+        return -1
 
     def manual_search(self):
         """手动触发搜索"""
@@ -3224,10 +3558,14 @@ class KnowledgeNavigator:
             self.status_bar.config(text=f"提示：请先加载知识库")
             return
 
-        # 执行搜索
-        self.search_knowledge_base(query)
+        # 手动搜索立即执行，取代尚未执行的语音搜索
+        self._cancel_pending_search()
 
-        # 如果搜索成功且关键词不在标签中，提示添加到常用标签
+        # 执行搜索，完成后再决定是否提示添加标签
+        self.search_knowledge_base(query, on_done=lambda: self._suggest_tag_for_query(query))
+
+    def _suggest_tag_for_query(self, query):
+        """如果搜索成功且关键词不在标签中，提示添加到常用标签"""
         try:
             if query and self.knowledge_base and query not in self.tags and len(self.current_matches) > 0:
                 if len(self.tags) < 10:  # 限制标签数量，避免过多
@@ -3249,19 +3587,18 @@ class KnowledgeNavigator:
         self.search_var.set("")
 
         # 清除匹配列表 - 修改为使用Treeview方法
-        for item in self.match_list.get_children():
-            self.match_list.delete(item)
+        self.match_list.delete(*self.match_list.get_children())
 
         # 清除文本中的高亮
         self.content_text.tag_remove("search_highlight", "1.0", tk.END)
 
         # 清除文本历史
-        self.text_history = []
+        self.text_history.clear()
 
         # 更新状态
         self.status_bar.config(text="搜索已清除")
 
-    def highlight_search_matches(self, query, matches):
+    def highlight_search_matches(self, query, matches, pattern=None):
         """在文本中高亮显示搜索匹配项"""
         # 清除之前的高亮
         self.content_text.tag_remove("search_highlight", "1.0", tk.END)
@@ -3270,60 +3607,84 @@ class KnowledgeNavigator:
         if not query or not matches:
             return
 
-        # 提取关键词
-        keywords = self.extract_keywords(query)
-
-        # 为关键词创建正则表达式
-        patterns = []
-        for keyword in keywords:
-            # 转义特殊字符
-            escaped_keyword = re.escape(keyword)
-            # 添加匹配模式
-            patterns.append(escaped_keyword)
-
-        # 如果没有有效的模式，直接返回
-        if not patterns:
-            return
-
-        # 创建合并的模式
-        pattern_str = '|'.join(patterns)
-        try:
-            pattern = re.compile(pattern_str, re.IGNORECASE)
-        except:
-            # 如果正则表达式编译失败，则返回
+        if pattern is None:
+            pattern = self._get_highlight_pattern(query)
+        if pattern is None:
             return
 
         # 在整个文本中查找匹配项
-        text_content = self.knowledge_base
-        for match in pattern.finditer(text_content):
-            start_pos = match.start()
-            end_pos = match.end()
-
-            # 转换字符位置为行列位置
-            start_line = text_content.count('\n', 0, start_pos) + 1
-            start_col = start_pos - text_content.rfind('\n', 0, start_pos) - 1
-            if start_col < 0:
-                start_col = 0
-
-            end_line = text_content.count('\n', 0, end_pos) + 1
-            end_col = end_pos - text_content.rfind('\n', 0, end_pos) - 1
-            if end_col < 0:
-                end_col = 0
-
-            # 添加高亮标记
+        spans = None
+        if AHOCORASICK_AVAILABLE and isinstance(pattern, ahocorasick.Automaton):
+            text_lower = self._lowercase_knowledge_base()
+            if len(text_lower) == len(self.knowledge_base):
+                # 自动机一次扫描找出所有关键词，值为关键词长度
+                spans = [(end - length + 1, end + 1) for end, length in pattern.iter(text_lower)]
+            else:
+                # 少数字符转小写后长度会变，位置对不上，改用正则
+                pattern = re.compile('|'.join(map(re.escape, pattern.keys())), re.IGNORECASE)
+        if spans is None:
+            spans = [match.span() for match in pattern.finditer(self.knowledge_base)]
+
+        # 转换为行列位置
+        ranges = []
+        for start, end in spans:
+            start_line, start_col = self._line_col(start)
+            end_line, end_col = self._line_col(end)
+            ranges.append(f"{start_line}.{start_col}")
+            ranges.append(f"{end_line}.{end_col}")
+
+        # 所有匹配范围一次性添加高亮标记
+        if ranges:
             try:
-                self.content_text.tag_add(
-                    "search_highlight",
-                    f"{start_line}.{start_col}",
-                    f"{end_line}.{end_col}"
-                )
-            except:
-                # 如果标记添加失败，跳过此匹配项
-                continue
+                self.content_text.tag_add("search_highlight", *ranges)
+            except tk.TclError:
+                pass
 
         # 配置高亮标记的样式
         self.content_text.tag_config("search_highlight", background="#FFFF66", foreground="#000000")
 
+    def _get_highlight_pattern(self, query):
+        """返回查询对应的高亮模式（Aho-Corasick自动机或正则），重复的查询直接使用缓存；可在后台线程调用"""
+        with self._hl_lock:
+            if query in self._hl_cache:
+                self._hl_cache.move_to_end(query)
+                return self._hl_cache[query]
+
+        keywords = self.extract_keywords(query)
+
+        pattern = None
+        if keywords and AHOCORASICK_AVAILABLE:
+            # 多个关键词共用一个自动机，只需扫描一遍文本
+            pattern = ahocorasick.Automaton()
+            for keyword in keywords:
+                pattern.add_word(keyword.lower(), len(keyword.lower()))
+            pattern.make_automaton()
+        elif keywords:
+            # 转义特殊字符后合并成一个模式
+            patterns = [re.escape(keyword) for keyword in keywords]
+            try:
+                pattern = re.compile('|'.join(patterns), re.IGNORECASE)
+            except re.error:
+                # 如果正则表达式编译失败，则不高亮
+                pattern = None
+
+        # 构建模式时不持有锁，只在写入缓存时加锁
+        with self._hl_lock:
+            self._hl_cache[query] = pattern
+            if len(self._hl_cache) > 64:
+                self._hl_cache.popitem(last=False)
+        return pattern
+
+    def _lowercase_knowledge_base(self, text=None, kb_version=None):
+        """返回小写的知识库文本，知识库不变时复用；后台线程须传入提交搜索时的文本和版本"""
+        if text is None:
+            text, kb_version = self.knowledge_base, self._kb_version
+        version, kb_lower = self._kb_lower_cache
+        if version != kb_version:
+            kb_lower = text.lower()
+            self._kb_lower_cache = (kb_version, kb_lower)
+        return kb_lower
+
     def setup_autocomplete(self):
         """为搜索框设置自动完成功能 - 优化版本 (修复self引用问题)"""
         # 初始化搜索历史记录
@@ -3663,48 +4024,76 @@ class KnowledgeNavigator:
         self.save_search_history()
 
     def build_toc(self):
-        """根据解析的标题构建目录树"""
+        """根据解析的标题构建目录树，子节点在展开时才插入"""
         # 清空现有项目
+        self.toc_tree.delete(*self.toc_tree.get_children())
+
+        # 用栈计算每个标题的父标题，-1表示根级别
+        self._toc_parent = []
+        self._toc_children = {-1: []}
+        stack = []
+        for i, level in enumerate(self._h_levels):
+            while stack and self._h_levels[stack[-1]] >= level:
+                stack.pop()
+            parent = stack[-1] if stack else -1
+            self._toc_parent.append(parent)
+            self._toc_children.setdefault(parent, []).append(i)
+            stack.append(i)
+
+        # 标题下标与树节点的对应关系，以及已插入子节点的标题
+        self._toc_items = {}
+        self._toc_item_index = {}
+        self._toc_loaded = set()
+
+        self._populate_toc_node(-1)
+
+        # 初始展开所有一级项目
         for item in self.toc_tree.get_children():
-            self.toc_tree.delete(item)
-
-        # 跟踪不同标题级别的父节点
-        parents = {0: ''}  # 根级别
-        last_item_at_level = {}
-
-        # 添加每个标题到树中
-        for i, heading in enumerate(self.heading_positions):
-            level = heading['level']
-            text = heading['text']
-
-            # 找到此标题的父节点
-            parent_level = 0
-            for l in sorted(parents.keys(), reverse=True):
-                if l < level:
-                    parent_level = l
-                    break
-            parent = parents[parent_level]
+            self._populate_toc_node(self._toc_item_index[item])
+            self.toc_tree.item(item, open=True)
 
-            # 添加标题到树中
+    def _populate_toc_node(self, index):
+        """插入某个标题的直接子节点（只在第一次调用时插入）"""
+        if index in self._toc_loaded:
+            return
+        self._toc_loaded.add(index)
+
+        # 删除占位节点
+        parent_item = self._toc_items.get(index, '')
+        if index >= 0:
+            self.toc_tree.delete(*self.toc_tree.get_children(parent_item))
+
+        for i in self._toc_children.get(index, ()):
             item_id = self.toc_tree.insert(
-                parent,
+                parent_item,
                 'end',
-                text=text,
-                values=(heading['position'],)
+                text=self._h_texts[i],
+                values=(self._h_positions[i],)
             )
-
-            # 更新父节点记录
-            parents[level] = item_id
-            last_item_at_level[level] = item_id
-
-            # 删除任何更深级别的父节点（因为它们不再有效）
-            keys_to_remove = [k for k in parents.keys() if k > level]
-            for k in keys_to_remove:
-                parents.pop(k, None)
-
-        # 初始展开所有一级项目
-        for item in self.toc_tree.get_children():
-            self.toc_tree.item(item, open=True)
+            self._toc_items[i] = item_id
+            self._toc_item_index[item_id] = i
+
+            # 有子标题时先放一个占位节点，使其显示展开箭头
+            if i in self._toc_children:
+                self.toc_tree.insert(item_id, 'end', text='')
+
+    def _ensure_toc_item(self, index):
+        """确保某个标题的目录节点已插入，返回节点ID"""
+        ancestors = []
+        parent = self._toc_parent[index]
+        while parent >= 0 and parent not in ancestors:
+            ancestors.append(parent)
+            parent = self._toc_parent[parent]
+
+        for ancestor in reversed(ancestors):
+            self._populate_toc_node(ancestor)
+        return self._toc_items.get(index)
+
+    def on_toc_open(self, event):
+        """目录项展开时插入其子节点"""
+        item_id = self.toc_tree.focus()
+        if item_id in self._toc_item_index:
+            self._populate_toc_node(self._toc_item_index[item_id])
 
     def render_markdown(self, markdown_text):
         """渲染Markdown文本到富文本显示"""
@@ -3713,60 +4102,52 @@ class KnowledgeNavigator:
         self.content_text.tag_configure("h2", font=("Arial", 16, "bold"), foreground="#0099CC", spacing3=4)
         self.content_text.tag_configure("h3", font=("Arial", 14, "bold"), foreground="#33CCCC", spacing3=3)
         self.content_text.tag_configure("h4", font=("Arial", 12, "bold"), spacing3=2)
-        self.content_text.tag_configure("bold", font=("Courier New", self.current_font_size, "bold"))
-        self.content_text.tag_configure("italic", font=("Courier New", self.current_font_size, "italic"))
-        self.content_text.tag_configure("code", font=("Consolas", self.current_font_size), background="#f0f0f0")
-        self.content_text.tag_configure("code_block", font=("Consolas", self.current_font_size), background="#f0f0f0",
-                                        spacing1=5, spacing3=5, relief=tk.GROOVE, borderwidth=1)
         self.content_text.tag_configure("bullet", lmargin1=20, lmargin2=30)
         self.content_text.tag_configure("link", foreground="blue", underline=1)
 
-        # 按行处理Markdown
+        # 按行处理Markdown，文本先放进缓冲区，最后一次性插入
         lines = markdown_text.split('\n')
         in_code_block = False
         code_block_content = []
+        self._md_runs = []
+        self._md_line = 1  # 下一段文本在控件中的行号
+
+        # 记录原文每一行渲染后所在的行号，定位时直接查表
+        self._rendered_lines = array('i')
 
-        i = 0
-        while i < len(lines):
-            line = lines[i]
+        for line in lines:
+            # 代码块中的行在代码块结束时才插入，按其在代码块中的序号推算行号
+            self._rendered_lines.append(self._md_line + len(code_block_content))
+            match = _BLOCK_RE.match(line)
+            kind = match.lastgroup if match else None
 
             # 处理代码块
-            if line.strip().startswith('```'):
+            if kind == 'fence':
                 if in_code_block:
                     # 结束代码块
                     code_text = '\n'.join(code_block_content)
-                    self.content_text.insert(tk.END, code_text, "code_block")
-                    self.content_text.insert(tk.END, "\n\n")
+                    self._md_emit(code_text, "code_block")
+                    self._md_emit("\n\n")
                     code_block_content = []
                     in_code_block = False
                 else:
                     # 开始代码块
                     in_code_block = True
-                i += 1
                 continue
 
             if in_code_block:
                 code_block_content.append(line)
-                i += 1
                 continue
 
-            # 处理标题
-            if line.startswith('# '):
-                self.content_text.insert(tk.END, line[2:], "h1")
-                self.content_text.insert(tk.END, "\n\n")
-            elif line.startswith('## '):
-                self.content_text.insert(tk.END, line[3:], "h2")
-                self.content_text.insert(tk.END, "\n\n")
-            elif line.startswith('### '):
-                self.content_text.insert(tk.END, line[4:], "h3")
-                self.content_text.insert(tk.END, "\n\n")
-            elif line.startswith('#### '):
-                self.content_text.insert(tk.END, line[5:], "h4")
-                self.content_text.insert(tk.END, "\n\n")
+            # 处理标题，标题总是从新的一行开始
+            if kind == 'h':
+                level = len(match.group('h'))
+                self._md_emit(line[level + 1:], _HEADING_TAG[level])
+                self._md_emit("\n\n")
             # 处理列表项
-            elif line.strip().startswith('- ') or line.strip().startswith('* '):
-                self.content_text.insert(tk.END, "• " + line.strip()[2:], "bullet")
-                self.content_text.insert(tk.END, "\n")
+            elif kind == 'bullet':
+                self._md_emit("• " + line.strip()[2:], "bullet")
+                self._md_emit("\n")
             # 处理普通段落
             else:
                 # 处理行内格式
@@ -3777,106 +4158,68 @@ class KnowledgeNavigator:
                     self.process_inline_markdown(processed_line)
                 else:
                     # 空行
-                    self.content_text.insert(tk.END, "\n")
-
-            i += 1
+                    self._md_emit("\n")
+
+        # 每段连续同标签文本合并成一对参数，只调用一次insert
+        args = []
+        for tag, parts in self._md_runs:
+            args.append(''.join(parts))
+            args.append(tag)
+        self._md_runs = []
+        if args:
+            self.content_text.insert(tk.END, *args)
+
+    def _md_emit(self, text, tag=""):
+        """把一段渲染后的文本加入缓冲区，相邻的同标签文本合并"""
+        self._md_line += text.count('\n')
+        if self._md_runs and self._md_runs[-1][0] == tag:
+            self._md_runs[-1][1].append(text)
+        else:
+            self._md_runs.append((tag, [text]))
 
     def process_inline_markdown(self, line):
         """处理行内Markdown格式"""
-        # 初始位置
         current_pos = 0
-        result = ""
-
-        # 解析行内格式
-        i = 0
-        while i < len(line):
-            # 检查加粗 (**text**)
-            if i + 1 < len(line) and line[i:i + 2] == '**':
-                # 先插入普通文本
-                if i > current_pos:
-                    self.content_text.insert(tk.END, line[current_pos:i])
-
-                # 寻找结束标记
-                end = line.find('**', i + 2)
-                if end != -1:
-                    # 提取加粗文本并应用tag
-                    bold_text = line[i + 2:end]
-                    self.content_text.insert(tk.END, bold_text, "bold")
-
-                    # 更新位置
-                    i = end + 2
-                    current_pos = i
-                    continue
-
-            # 检查斜体 (*text*)
-            elif line[i] == '*' and (i == 0 or line[i - 1] != '*') and (i + 1 < len(line) and line[i + 1] != '*'):
-                # 先插入普通文本
-                if i > current_pos:
-                    self.content_text.insert(tk.END, line[current_pos:i])
-
-                # 寻找结束标记
-                end = line.find('*', i + 1)
-                if end != -1:
-                    # 提取斜体文本并应用tag
-                    italic_text = line[i + 1:end]
-                    self.content_text.insert(tk.END, italic_text, "italic")
-
-                    # 更新位置
-                    i = end + 1
-                    current_pos = i
-                    continue
 
-            # 检查行内代码 (`code`)
-            elif line[i] == '`':
-                # 先插入普通文本
-                if i > current_pos:
-                    self.content_text.insert(tk.END, line[current_pos:i])
-
-                # 寻找结束标记
-                end = line.find('`', i + 1)
-                if end != -1:
-                    # 提取代码文本并应用tag
-                    code_text = line[i + 1:end]
-                    self.content_text.insert(tk.END, code_text, "code")
-
-                    # 更新位置
-                    i = end + 1
-                    current_pos = i
-                    continue
+        # 依次处理加粗、斜体和行内代码，组名即为对应的文本标签
+        for match in _INLINE_RE.finditer(line):
+            # 先插入普通文本
+            if match.start() > current_pos:
+                self._md_emit(line[current_pos:match.start()])
 
-            i += 1
+            self._md_emit(match.group(match.lastgroup), match.lastgroup)
+            current_pos = match.end()
 
         # 插入剩余文本
         if current_pos < len(line):
-            self.content_text.insert(tk.END, line[current_pos:])
+            self._md_emit(line[current_pos:])
 
         # 添加换行
-        self.content_text.insert(tk.END, "\n")
+        self._md_emit("\n")
 
     def find_all_pairs(self, text, start_marker, end_marker):
-        """找出所有成对的标记"""
-        result = []
-        pos = 0
-
-        while True:
-            start = text.find(start_marker, pos)
-            if start == -1:
-                break
-
-            end = text.find(end_marker, start + len(start_marker))
-            if end == -1:
-                break
-
-            result.append((start, end + len(end_marker)))
-            pos = end + len(end_marker)
-
+        """找出所有成对的标记，对知识库全文的结果按版本缓存"""
+        key = (start_marker, end_marker)
+        cacheable = text is self.knowledge_base
+        if cacheable:
+            if self._pair_cache_version != self._kb_version:
+                self._pair_cache.clear()
+                self._pair_cache_version = self._kb_version
+            if key in self._pair_cache:
+                return self._pair_cache[key]
+
+        pattern = re.compile(re.escape(start_marker) + '.*?' + re.escape(end_marker), re.DOTALL)
+        result = [m.span() for m in pattern.finditer(text)]
+
+        if cacheable:
+            self._pair_cache[key] = result
         return result
 
     def display_knowledge_base(self):
         """在界面中显示知识库内容，支持Markdown渲染"""
-        # 启用文本区域进行编辑
-        self.content_text.config(state=tk.NORMAL)
-        self.content_text.delete(1.0, tk.END)
+        # 界面上已经是同一份内容（如重新加载未修改的文件）时不必重新渲染
+        if self.knowledge_base is self._rendered_text and self.knowledge_path == self._rendered_path:
+            return
 
         # 检查是否为Markdown文件
         is_markdown = self.knowledge_path and self.knowledge_path.lower().endswith('.md')
@@ -3884,84 +4227,98 @@ class KnowledgeNavigator:
         # 创建位置映射字典，用于存储原始位置到渲染后位置的映射
         self.position_mapping = {}
 
-        if is_markdown:
-            # 使用Markdown渲染器显示
-            self.render_markdown(self.knowledge_base)
-
-            # 记录渲染后的所有标题位置，用于目录导航
-            # (由于标签的存在，原始字符位置可能无法直接使用)
-            for heading in self.heading_positions:
-                # 在渲染后的文本中找到对应标题
-                search_text = heading['text']
-                start_idx = "1.0"
-                while True:
-                    pos = self.content_text.search(search_text, start_idx, stopindex=tk.END)
-                    if not pos:
-                        break
+        # 记录每行的起始位置，字符位置转行列时二分查找
+        self._line_starts = array('q', [0])
+        self._line_starts.extend(m.end() for m in re.finditer('\n', self.knowledge_base))
 
-                    # 验证这确实是标题而不是内容中相同的文本
-                    # 检查周围文本或标签来确认
-                    line_start = pos.split('.')[0]
-                    if self.content_text.tag_names(pos):
-                        tags = self.content_text.tag_names(pos)
-                        # 如果有一个标题标签，这可能是正确的位置
-                        if any(tag.startswith('h') for tag in tags):
-                            heading['rendered_position'] = pos
-                            self.position_mapping[heading['position']] = pos
-                            break
+        # 临时启用文本区域进行编辑，完成后恢复只读
+        with self._editable():
+            self.content_text.delete(1.0, tk.END)
 
-                    # 尝试下一个匹配
-                    start_idx = self.content_text.index(f"{pos}+1c")
-        else:
-            # 非Markdown文件使用原有展示方式
-            self.content_text.insert(tk.END, self.knowledge_base)
-
-            # 高亮显示所有标题
-            for heading in self.heading_positions:
-                position = heading['position']
-                # 将字符位置转换为行列位置
-                line_start = self.knowledge_base.count('\n', 0, position) + 1
-                col_start = position - self.knowledge_base.rfind('\n', 0, position) - 1
-                if col_start < 0:
-                    col_start = 0
-
-                # 计算标题的结束位置
-                raw_heading = heading['raw']
-                line_end = line_start + raw_heading.count('\n')
-
-                if line_start == line_end:
-                    col_end = col_start + len(raw_heading)
-                    start_pos = f"{line_start}.{col_start}"
-                    end_pos = f"{line_end}.{col_end}"
-                else:
-                    # 多行标题的情况
-                    last_line_length = len(raw_heading.split('\n')[-1])
-                    start_pos = f"{line_start}.{col_start}"
-                    end_pos = f"{line_end}.{last_line_length}"
-
-                # 根据标题级别设置不同的颜色
-                level = heading.get('level', 1)
-
-                # 标记标题文本
-                self.content_text.tag_add(f"heading_{position}", start_pos, end_pos)
-
-                # 根据标题级别设置字体大小和颜色
-                font_size = max(self.current_font_size, self.current_font_size + 5 - level)  # 一级标题最大，依次递减
-                if level == 1:
-                    color = "#0066CC"  # 深蓝色
-                elif level == 2:
-                    color = "#0099CC"  # 中蓝色
-                else:
-                    color = "#33CCCC"  # 浅蓝色
+            if is_markdown:
+                # 使用Markdown渲染器显示
+                self.render_markdown(self.knowledge_base)
 
-                self.content_text.tag_config(
-                    f"heading_{position}",
-                    foreground=color,
-                    font=("Courier New", font_size, "bold")
-                )
+                # 记录渲染后的所有标题位置，用于目录导航
+                # (由于标签的存在，原始字符位置可能无法直接使用)
+                for heading in self.heading_positions:
+                    rendered_position = self._rendered_index(heading['position'])
+                    if rendered_position:
+                        heading['rendered_position'] = rendered_position
+                        self.position_mapping[heading['position']] = rendered_position
+            else:
+                # 非Markdown文件使用原有展示方式
+                self.content_text.insert(tk.END, self.knowledge_base)
 
-        # 禁用文本区域，防止编辑
-        self.content_text.config(state=tk.DISABLED)
+                # 高亮显示所有标题，同一级别的标题共用一个标签，一次性添加
+                ranges_by_level = {}
+                for heading in self.heading_positions:
+                    position = heading['position']
+                    # 将字符位置转换为行列位置
+                    line_start, col_start = self._line_col(position)
+
+                    # 计算标题的结束位置
+                    raw_heading = heading['raw']
+                    line_end = line_start + raw_heading.count('\n')
+
+                    if line_start == line_end:
+                        col_end = col_start + len(raw_heading)
+                        start_pos = f"{line_start}.{col_start}"
+                        end_pos = f"{line_end}.{col_end}"
+                    else:
+                        # 多行标题的情况
+                        last_line_length = len(raw_heading.split('\n')[-1])
+                        start_pos = f"{line_start}.{col_start}"
+                        end_pos = f"{line_end}.{last_line_length}"
+
+                    # 五级及以下的标题样式相同
+                    level = min(heading.get('level', 1), 6)
+                    ranges_by_level.setdefault(level, []).extend((start_pos, end_pos))
+
+                # 标记标题文本，样式已在_configure_font_tags中配置
+                for level, ranges in ranges_by_level.items():
+                    self.content_text.tag_add(f"heading_level{level}", *ranges)
+
+        self._rendered_text = self.knowledge_base
+        self._rendered_path = self.knowledge_path
+        self._last_line = int(self.content_text.index('end-1c').split('.')[0])
+        self._ctx_cache.clear()
+
+    def _configure_font_tags(self):
+        """按当前字体大小配置与字号相关的文本标签，改变字号时只需重新配置"""
+        # 文本文件各级标题
+        for level in range(1, 7):
+            font_size = max(self.current_font_size, self.current_font_size + 5 - level)  # 一级标题最大，依次递减
+            if level == 1:
+                color = "#0066CC"  # 深蓝色
+            elif level == 2:
+                color = "#0099CC"  # 中蓝色
+            else:
+                color = "#33CCCC"  # 浅蓝色
+            self.content_text.tag_config(
+                f"heading_level{level}",
+                foreground=color,
+                font=("Courier New", font_size, "bold")
+            )
+
+        # Markdown行内格式和代码块
+        self.content_text.tag_configure("bold", font=("Courier New", self.current_font_size, "bold"))
+        self.content_text.tag_configure("italic", font=("Courier New", self.current_font_size, "italic"))
+        self.content_text.tag_configure("code", font=("Consolas", self.current_font_size), background="#f0f0f0")
+        self.content_text.tag_configure("code_block", font=("Consolas", self.current_font_size), background="#f0f0f0",
+                                        spacing1=5, spacing3=5, relief=tk.GROOVE, borderwidth=1)
+
+    def _line_col(self, position):
+        """把知识库中的字符位置转换为(行, 列)，行号从1开始"""
+        line = bisect.bisect_right(self._line_starts, position) - 1
+        return line + 1, position - self._line_starts[line]
+
+    def _rendered_index(self, position):
+        """把知识库中的字符位置转换为Markdown渲染后该行行首的索引，没有记录时返回None"""
+        line = bisect.bisect_right(self._line_starts, position) - 1
+        if 0 <= line < len(self._rendered_lines):
+            return f"{self._rendered_lines[line]}.0"
+        return None
 
     def change_speech_engine(self):
         """更改语音识别引擎"""
@@ -3975,12 +4332,40 @@ class KnowledgeNavigator:
         self.speech_engine = new_engine
 
         if self.speech_engine == "Vosk" and not self.vosk_model and VOSK_AVAILABLE:
+            model_path = os.path.join("models", "vosk-model-small-cn-0.22")
+            if os.path.exists(model_path):
+                # 模型加载耗时较长，放到后台线程，加载期间禁用监听按钮
+                self.listen_button.config(state=tk.DISABLED)
+                self.status_bar.config(text="正在后台加载Vosk模型...")
+                threading.Thread(target=self._preload_vosk_model, args=(model_path,), daemon=True).start()
+                return
+
             # self.messagebox.showinfo("提示", "请先下载Vosk模型，或者切换到其他语音引擎。")
             self.status_bar.config(text=f"请先下载Vosk模型，或者切换到其他语音引擎。")
 
         # self.messagebox.showinfo("语音引擎已更改", f"已切换到 {new_engine} 语音识别引擎")
         self.status_bar.config(text=f"语音引擎已更改：已切换到 {new_engine} 语音识别引擎")
 
+    def _preload_vosk_model(self, model_path, announce=True):
+        """在后台线程加载Vosk模型，announce为True时完成后回到主线程恢复监听按钮并提示"""
+        message = "语音引擎已更改：已切换到 Vosk 语音识别引擎"
+        with self._vosk_lock:
+            if not self.vosk_model:
+                try:
+                    self.vosk_model = Model(model_path)
+                    message = "语音引擎已更改：Vosk模型加载成功"
+                except Exception as e:
+                    message = f"加载Vosk模型失败: {str(e)}"
+
+        if not announce:
+            return
+
+        def finish():
+            self.listen_button.config(state=tk.NORMAL)
+            self.status_bar.config(text=message)
+
+        self.root.after(0, finish)
+
     def download_vosk_model(self):
         """提供Vosk模型下载指南"""
         if not VOSK_AVAILABLE:
@@ -4072,9 +4457,8 @@ class KnowledgeNavigator:
             self.current_font_size += 1
             self.content_text.config(font=("Courier New", self.current_font_size))
 
-            # 刷新标题样式
-            if self.knowledge_base:
-                self.display_knowledge_base()
+            # 刷新标题样式，只需重新配置标签，不必重新渲染
+            self._configure_font_tags()
 
             self.status_bar.config(text=f"字体大小: {self.current_font_size}")
 
@@ -4085,32 +4469,34 @@ class KnowledgeNavigator:
             self.current_font_size -= 1
             self.content_text.config(font=("Courier New", self.current_font_size))
 
-            # 刷新标题样式
-            if self.knowledge_base:
-                self.display_knowledge_base()
+            # 刷新标题样式，只需重新配置标签，不必重新渲染
+            self._configure_font_tags()
 
             self.status_bar.config(text=f"字体大小: {self.current_font_size}")
 
     def expand_all_toc(self, expand):
         """展开或折叠所有目录项"""
-        for item in self.toc_tree.get_children():
-            self.expand_item_recursive(item, expand)
+        tree = self.toc_tree
+        get_children = tree.get_children
+        set_item = tree.item
+        populate = self._populate_toc_node
+        item_index = self._toc_item_index
+
+        # 用显式栈遍历整棵树，避免逐层递归调用
+        stack = list(get_children())
+        while stack:
+            item = stack.pop()
+            if expand and item in item_index:
+                populate(item_index[item])
+
+            children = get_children(item)
+            if children:
+                set_item(item, open=expand)
+                stack.extend(children)
 
         status = "展开" if expand else "折叠"
         self.status_bar.config(text=f"已{status}所有目录项")
 
-    def expand_item_recursive(self, item, expand):
-        """递归展开或折叠目录项及其子项"""
-        children = self.toc_tree.get_children(item)
-        if children:
-            if expand:
-                self.toc_tree.item(item, open=True)
-            else:
-                self.toc_tree.item(item, open=False)
-
-            for child in children:
-                self.expand_item_recursive(child, expand)
-
     def toggle_listening(self):
         """切换语音监听状态"""
         if not SPEECH_AVAILABLE:
@@ -4156,6 +4542,11 @@ class KnowledgeNavigator:
             threading.Thread(target=self.start_vosk_listening, daemon=True).start()
             return
 
+        # Google Cloud流式识别边录音边上传
+        if engine == "GoogleCloud" and GCLOUD_SPEECH_AVAILABLE:
+            threading.Thread(target=self.start_gcloud_streaming, daemon=True).start()
+            return
+
         # 创建一个标志用于跟踪麦克风初始化
         mic_initialized = False
 
@@ -4176,24 +4567,58 @@ class KnowledgeNavigator:
             self._run_speech_recognition_loop(engine)
 
     def _run_speech_recognition_loop(self, engine):
-        """语音识别主循环，分离为单独的方法以提高代码可维护性"""
-        recognition_errors = 0  # 跟踪连续错误
+        """语音识别主循环：本线程只负责录音，识别交给后台线程，录音与识别同时进行"""
+        audio_queue = queue.Queue()
+        threading.Thread(target=self._recognition_worker, args=(audio_queue, engine), daemon=True).start()
+
+        capture_errors = 0  # 跟踪连续错误
         max_errors = 5  # 最大连续错误次数
 
-        while self.listening:
-            try:
-                with self.mic as source:
-                    self.status_bar.config(text="语音监听: 正在听...")
-                    # 使用更合理的超时设置
-                    audio = self.recognizer.listen(source, timeout=5)
+        try:
+            while self.listening:
+                try:
+                    with self.mic as source:
+                        self.status_bar.config(text="语音监听: 正在听...")
+                        # 使用更合理的超时设置
+                        audio = self.recognizer.listen(source, timeout=5)
 
-                    # 添加到音频缓冲区
-                    self.audio_buffer.append(audio)
-                    if len(self.audio_buffer) > self.max_buffer_size:
-                        self.audio_buffer.pop(0)
+                        # 添加到音频缓冲区
+                        self.audio_buffer.append(audio)
 
-                self.status_bar.config(text="语音监听: 正在处理...")
+                    # 立即交给识别线程，然后继续录下一段
+                    capture_errors = 0
+                    self.status_bar.config(text="语音监听: 正在处理...")
+                    audio_queue.put(audio)
 
+                except sr.WaitTimeoutError:
+                    self.status_bar.config(text="语音监听: 等待输入...")
+                    continue
+                except Exception as e:
+                    self.status_bar.config(text=f"语音监听错误: {type(e).__name__}: {e}")
+                    time.sleep(0.5)
+                    capture_errors += 1
+                    if capture_errors >= max_errors:
+                        self.root.after(0, self.toggle_listening)
+                        break
+                    continue
+        finally:
+            # 通知识别线程退出
+            audio_queue.put(None)
+
+    def _recognition_worker(self, audio_queue, engine):
+        """后台识别线程，依次识别录音线程送来的音频段"""
+        recognition_errors = 0  # 跟踪连续错误
+        max_errors = 5  # 最大连续错误次数
+
+        while True:
+            audio = audio_queue.get()
+            if audio is None:
+                break
+            # 监听已停止时丢弃剩余音频
+            if not self.listening:
+                continue
+
+            try:
                 # 根据引擎进行识别
                 text = self._recognize_audio(audio, engine)
 
@@ -4201,16 +4626,11 @@ class KnowledgeNavigator:
                     recognition_errors = 0  # 重置错误计数
                     # 添加到文本历史
                     self.text_history.append(text)
-                    if len(self.text_history) > 5:
-                        self.text_history.pop(0)
 
                     # 更新搜索框并执行搜索
                     self.search_var.set(text)
-                    self.root.after(0, self.search_knowledge_base, text)
+                    self.root.after(0, self._schedule_search, text)
 
-            except sr.WaitTimeoutError:
-                self.status_bar.config(text="语音监听: 等待输入...")
-                continue
             except sr.UnknownValueError:
                 recognition_errors += 1
                 self.status_bar.config(text=f"语音监听: 未能识别({recognition_errors}/{max_errors})，请再说一遍...")
@@ -4218,7 +4638,6 @@ class KnowledgeNavigator:
                     self.status_bar.config(text="多次未能识别语音，请检查麦克风设置或尝试其他引擎")
                     self.root.after(0, self.toggle_listening)  # 安全地切换状态
                     break
-                continue
             except sr.RequestError as e:
                 self.status_bar.config(text=f"语音识别请求错误: {e}")
                 if "Google" in engine:
@@ -4227,12 +4646,10 @@ class KnowledgeNavigator:
                 break
             except Exception as e:
                 self.status_bar.config(text=f"语音监听错误: {type(e).__name__}: {e}")
-                time.sleep(0.5)
                 recognition_errors += 1
                 if recognition_errors >= max_errors:
                     self.root.after(0, self.toggle_listening)
                     break
-                continue
 
     def _recognize_audio(self, audio, engine):
         """根据不同引擎识别音频，分离为单独方法以便于扩展和测试"""
@@ -4251,7 +4668,7 @@ class KnowledgeNavigator:
     def start_vosk_listening(self):
         """使用Vosk离线引擎进行语音识别"""
         if not VOSK_AVAILABLE:
-            self.status_bar.config(text="Vosk语音识别功能不可用。请安装vosk模块")
+            self._post_status("Vosk语音识别功能不可用。请安装vosk模块")
             self.root.after(0, self.toggle_listening)  # 安全地切换状态
             return
 
@@ -4259,40 +4676,51 @@ class KnowledgeNavigator:
         if not self._initialize_vosk_model():
             return
 
-        # 初始化音频流
-        stream, p = self._initialize_vosk_audio_stream()
+        # 初始化音频流，录音回调只把音频块放入队列，识别在本线程进行
+        audio_queue = queue.Queue(maxsize=64)
+        stream, p = self._open_audio_stream(audio_queue)
         if not stream:
             return
 
         try:
-            # 创建识别器
-            recognizer = KaldiRecognizer(self.vosk_model, 16000)
+            # 复用上次监听的识别器
+            recognizer = self._get_vosk_recognizer()
             recognition_errors = 0
             max_errors = 5
+            last_partial = ""
 
+            self._post_status("语音监听: 正在听(Vosk)...")
             while self.listening:
                 try:
-                    self.status_bar.config(text="语音监听: 正在听(Vosk)...")
-                    data = stream.read(4000, exception_on_overflow=False)
+                    # 每次取0.25秒音频，超时后重新检查监听状态
+                    try:
+                        data = audio_queue.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
 
                     if recognizer.AcceptWaveform(data):
                         result = json.loads(recognizer.Result())
                         text = result.get("text", "")
+                        last_partial = ""
 
                         if text:
                             recognition_errors = 0  # 重置错误计数
                             self.text_history.append(text)
-                            if len(self.text_history) > 5:
-                                self.text_history.pop(0)
 
                             # 更新搜索框并执行搜索
-                            self.search_var.set(text)
-                            self.root.after(0, self.search_knowledge_base, text)
+                            self.root.after(0, self.search_var.set, text)
+                            self.root.after(0, self._schedule_search, text)
+                        self._post_status("语音监听: 正在听(Vosk)...")
+                    else:
+                        # 说话过程中显示中间识别结果
+                        partial = json.loads(recognizer.PartialResult()).get("partial", "")
+                        if partial and partial != last_partial:
+                            last_partial = partial
+                            self._post_status(f"语音监听(Vosk): {partial}")
 
                 except Exception as e:
                     recognition_errors += 1
-                    self.status_bar.config(text=f"Vosk错误: {type(e).__name__}: {str(e)}")
-                    time.sleep(0.5)
+                    self._post_status(f"Vosk错误: {type(e).__name__}: {str(e)}")
                     if recognition_errors >= max_errors:
                         self.root.after(0, self.toggle_listening)
                         break
@@ -4304,50 +4732,168 @@ class KnowledgeNavigator:
                 stream.close()
             if 'p' in locals() and p:
                 p.terminate()
-            self.status_bar.config(text="Vosk语音识别已停止")
+            self._post_status("Vosk语音识别已停止")
 
-    def _initialize_vosk_model(self):
-        """初始化Vosk模型，返回是否成功"""
-        model_path = os.path.join("models", "vosk-model-small-cn-0.22")
-        self.status_bar.config(text="正在检查Vosk模型...")
+    def start_gcloud_streaming(self):
+        """使用Google Cloud流式识别：录音的同时上传音频，说话过程中即可得到中间结果"""
+        try:
+            client = gcloud_speech.SpeechClient()
+        except Exception as e:
+            self._post_status(f"Google Cloud语音服务初始化失败: {type(e).__name__}: {e}")
+            self.root.after(0, self.toggle_listening)
+            return
 
-        if not self.vosk_model:
-            # 尝试加载模型
-            if os.path.exists(model_path):
+        # 每块0.1秒音频，上传粒度更细，识别结果返回更快
+        audio_queue = queue.Queue(maxsize=64)
+        stream, p = self._open_audio_stream(audio_queue, frames_per_buffer=1600)
+        if not stream:
+            return
+
+        config = gcloud_speech.RecognitionConfig(
+            encoding=gcloud_speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=16000,
+            language_code="zh-CN")
+        # 单句模式：检测到一句话结束后服务端立即返回最终结果
+        streaming_config = gcloud_speech.StreamingRecognitionConfig(
+            config=config, single_utterance=True, interim_results=True)
+        end_of_utterance = gcloud_speech.StreamingRecognizeResponse.SpeechEventType.END_OF_SINGLE_UTTERANCE
+
+        recognition_errors = 0
+        max_errors = 5
+        try:
+            # 每句话一次流式请求，直到停止监听
+            while self.listening:
+                utterance_done = threading.Event()
+
+                def requests():
+                    while self.listening and not utterance_done.is_set():
+                        try:
+                            chunk = audio_queue.get(timeout=0.5)
+                        except queue.Empty:
+                            continue
+                        yield gcloud_speech.StreamingRecognizeRequest(audio_content=chunk)
+
+                self._post_status("语音监听: 正在听(Google Cloud)...")
                 try:
-                    self.vosk_model = Model(model_path)
-                    self.status_bar.config(text="Vosk模型加载成功")
-                    return True
+                    for response in client.streaming_recognize(config=streaming_config, requests=requests()):
+                        if response.speech_event_type == end_of_utterance:
+                            utterance_done.set()
+                        for result in response.results:
+                            if not result.alternatives:
+                                continue
+                            text = result.alternatives[0].transcript.strip()
+                            if not text:
+                                continue
+
+                            # 中间结果只更新搜索框，最终结果才执行搜索
+                            self.root.after(0, self.search_var.set, text)
+                            if result.is_final:
+                                recognition_errors = 0
+                                self.text_history.append(text)
+                                self.root.after(0, self._schedule_search, text)
+                            else:
+                                self._post_status(f"语音监听(Google Cloud): {text}")
                 except Exception as e:
-                    self.status_bar.config(text=f"加载Vosk模型失败: {str(e)}")
-                    self.messagebox.showerror("错误", f"加载Vosk模型失败: {str(e)}")
+                    recognition_errors += 1
+                    self._post_status(f"Google Cloud识别错误: {type(e).__name__}: {e}")
+                    if recognition_errors >= max_errors:
+                        self.root.after(0, self.toggle_listening)
+                        break
+                    time.sleep(0.5)
+                finally:
+                    utterance_done.set()
+        finally:
+            stream.stop_stream()
+            stream.close()
+            p.terminate()
+            self._post_status("Google Cloud语音识别已停止")
+
+    def _post_status(self, text):
+        """后台线程更新状态栏：消息只放入队列，由主线程取出显示"""
+        try:
+            self._status_queue.put_nowait(text)
+        except queue.Full:
+            # 主线程来不及显示时丢弃最早的消息
+            try:
+                self._status_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._status_queue.put_nowait(text)
+
+    def _drain_status_queue(self):
+        """定时取出后台线程的状态消息，只显示最新的一条"""
+        text = None
+        try:
+            while True:
+                text = self._status_queue.get_nowait()
+        except queue.Empty:
+            pass
+        if text is not None:
+            self.status_bar.config(text=text)
+        self.root.after(100, self._drain_status_queue)
+
+    def _initialize_vosk_model(self):
+        """初始化Vosk模型，返回是否成功；在监听线程中调用，界面更新交给主线程"""
+        model_path = os.path.join("models", "vosk-model-small-cn-0.22")
+        self._post_status("正在检查Vosk模型...")
+
+        # 后台预加载进行中时等待其完成
+        with self._vosk_lock:
+            if not self.vosk_model:
+                # 尝试加载模型
+                if os.path.exists(model_path):
+                    try:
+                        self.vosk_model = Model(model_path)
+                        self._post_status("Vosk模型加载成功")
+                        return True
+                    except Exception as e:
+                        self._post_status(f"加载Vosk模型失败: {str(e)}")
+                        self.root.after(0, self.messagebox.showerror, "错误", f"加载Vosk模型失败: {str(e)}")
+                        self.root.after(0, self.toggle_listening)
+                        return False
+                else:
+                    self._post_status("Vosk模型未找到。请下载模型或切换到其他引擎。")
+                    self.root.after(0, self.messagebox.showwarning, "警告", "Vosk模型未找到。请下载模型或切换到其他引擎。")
                     self.root.after(0, self.toggle_listening)
                     return False
-            else:
-                self.status_bar.config(text="Vosk模型未找到。请下载模型或切换到其他引擎。")
-                self.messagebox.showwarning("警告", "Vosk模型未找到。请下载模型或切换到其他引擎。")
-                self.root.after(0, self.toggle_listening)
-                return False
         return True
 
-    def _initialize_vosk_audio_stream(self):
-        """初始化Vosk音频流，返回(stream, p)或(None, None)"""
+    def _get_vosk_recognizer(self):
+        """返回实时监听用的16kHz Kaldi识别器，模型更换后重建，复用前先Reset；只在监听线程中使用"""
+        cached = self._vosk_recognizer
+        if cached is None or cached[0] is not self.vosk_model:
+            cached = self._vosk_recognizer = (self.vosk_model, KaldiRecognizer(self.vosk_model, 16000))
+        else:
+            cached[1].Reset()
+        return cached[1]
+
+    def _open_audio_stream(self, audio_queue, frames_per_buffer=4000):
+        """初始化16kHz单声道音频流，录到的音频块放入audio_queue，返回(stream, p)或(None, None)；在监听线程中调用"""
         try:
             import pyaudio
             p = pyaudio.PyAudio()
 
+            def on_audio(in_data, frame_count, time_info, status):
+                # 录音回调中不做任何识别，识别跟不上时丢弃最新的音频块
+                try:
+                    audio_queue.put_nowait(in_data)
+                except queue.Full:
+                    pass
+                return None, pyaudio.paContinue
+
             # 打开音频流
             stream = p.open(format=pyaudio.paInt16,
                             channels=1,
                             rate=16000,
                             input=True,
-                            frames_per_buffer=8000)
+                            frames_per_buffer=frames_per_buffer,  # 默认每块0.25秒
+                            stream_callback=on_audio)
             stream.start_stream()
-            self.status_bar.config(text="Vosk音频流初始化成功")
+            self._post_status("音频流初始化成功")
             return stream, p
         except Exception as e:
-            self.status_bar.config(text=f"初始化音频流失败: {type(e).__name__}: {str(e)}")
-            self.messagebox.showerror("错误", f"初始化音频流失败: {str(e)}")
+            self._post_status(f"初始化音频流失败: {type(e).__name__}: {str(e)}")
+            self.root.after(0, self.messagebox.showerror, "错误", f"初始化音频流失败: {str(e)}")
             self.root.after(0, self.toggle_listening)
             return None, None
     def diagnose_speech_recognition(self):
@@ -4358,6 +4904,7 @@ class KnowledgeNavigator:
         diagnosis += "1. 依赖库检查:\n"
         diagnosis += f"   - speech_recognition: {'已安装' if SPEECH_AVAILABLE else '未安装'}\n"
         diagnosis += f"   - vosk: {'已安装' if VOSK_AVAILABLE else '未安装'}\n"
+        diagnosis += f"   - google-cloud-speech: {'已安装' if GCLOUD_SPEECH_AVAILABLE else '未安装'}\n"
         diagnosis += f"   - pyaudio: {'已安装' if 'pyaudio' in sys.modules else '未安装'}\n\n"
 
         # 检查语音引擎
@@ -4423,7 +4970,37 @@ class KnowledgeNavigator:
 
         # 合并现有文本历史
         if self.text_history:
-            combined_text = " ".join(self.text_history)
+            self._finish_long_conversation(" ".join(self.text_history))
+        else:
+            # 没有识别出文本时，在后台重新识别缓存的音频段
+            segments = list(self.audio_buffer)
+            self.status_bar.config(text=f"正在识别{len(segments)}段缓存的语音...")
+            threading.Thread(target=self._recognize_buffered_audio, args=(segments, self.speech_engine),
+                             daemon=True).start()
+
+    def _recognize_buffered_audio(self, segments, engine):
+        """并行识别缓存的音频段，完成后回到主线程合并搜索"""
+        with ThreadPoolExecutor(max_workers=min(4, len(segments))) as pool:
+            texts = list(pool.map(lambda audio: self._recognize_segment(audio, engine), segments))
+        combined_text = " ".join(text for text in texts if text)
+        self.root.after(0, self._finish_long_conversation, combined_text)
+
+    def _recognize_segment(self, audio, engine):
+        """识别一段缓存的音频，Vosk模型已加载时离线识别，失败返回空字符串"""
+        try:
+            if engine == "Vosk" and VOSK_AVAILABLE and self.vosk_model:
+                # 各段在多个线程中并行识别，每段使用独立的识别器
+                recognizer = KaldiRecognizer(self.vosk_model, 16000)
+                recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=16000, convert_width=2))
+                return json.loads(recognizer.FinalResult()).get("text", "")
+            return self._recognize_audio(audio, engine)
+        except Exception as e:
+            print(f"识别缓存音频失败: {type(e).__name__}: {e}")
+            return ""
+
+    def _finish_long_conversation(self, combined_text):
+        """用合并后的长对话文本搜索知识库"""
+        if combined_text:
             self.search_var.set(combined_text)
             self.search_knowledge_base(combined_text)
             # self.messagebox.showinfo("处理完成", f"已处理长对话并搜索关键词:\n\n{combined_text}")
@@ -4435,58 +5012,32 @@ class KnowledgeNavigator:
 
     def extract_keywords(self, text):
         """从文本中提取重要关键词，支持中英文"""
-        keywords = []
-
-        # 对于中文文本，使用jieba分词（如果可用）
-        chinese_text = any('\u4e00' <= char <= '\u9fff' for char in text)
-        if chinese_text and JIEBA_AVAILABLE:
-            words = jieba.cut(text)
-            # 过滤掉常见词和短词
-            keywords = [word for word in words if len(word) >= 2 and not word.isdigit()]
-
-        # 对于英文和混合文本
-        if NLTK_AVAILABLE:
-            # 使用NLTK处理英文
-            try:
-                stop_words = set(stopwords.words('english'))
-                words = word_tokenize(text)
-                eng_keywords = [word.lower() for word in words
-                                if word.isalnum() and len(word) > 2
-                                and word.lower() not in stop_words]
-                keywords.extend(eng_keywords)
-            except:
-                # 如果NLTK失败，回退到简单方法
-                eng_words = re.findall(r'\b[a-zA-Z]{3,}\b', text)
-                keywords.extend([word.lower() for word in eng_words])
-        else:
-            # 不使用NLTK的简单方法
-            eng_words = re.findall(r'\b[a-zA-Z]{3,}\b', text)
-            keywords.extend([word.lower() for word in eng_words])
-
-        # 提取技术术语和特殊格式词
-        tech_terms = re.findall(r'\b[a-zA-Z0-9]+(?:[._-][a-zA-Z0-9]+)*\b', text)
-        tech_terms = [term for term in tech_terms if len(term) > 3 and ('.' in term or '_' in term or '-' in term)]
-        keywords.extend(tech_terms)
-
-        # 如果没有找到任何关键词，使用原始查询
-        if not keywords and len(text) < 50:
-            keywords.append(text)
-
-        # 去除重复项
-        return list(set(keywords))
-
-    def search_knowledge_base(self, query):
-        """在知识库中搜索关键词，支持模糊匹配 - 优化版"""
-        start_time = time.time()  # 计时开始
-
+        # 同一句话（反复识别、点击标签）直接复用上次的提取结果
+        return list(_extract_keywords(text))
+
+    def _schedule_search(self, text):
+        """语音识别结果稍后再搜索，连续识别时只搜索最后一句"""
+        self._cancel_pending_search()
+        self._pending_search_job = self.root.after(250, self._run_pending_search, text)
+
+    def _run_pending_search(self, text):
+        """执行延迟的语音搜索"""
+        self._pending_search_job = None
+        self.search_knowledge_base(text)
+
+    def _cancel_pending_search(self):
+        """取消尚未执行的语音搜索"""
+        if self._pending_search_job:
+            self.root.after_cancel(self._pending_search_job)
+            self._pending_search_job = None
+
+    def search_knowledge_base(self, query, on_done=None):
+        """在知识库中搜索关键词，支持模糊匹配 - 计算在后台线程进行，完成后回到主线程更新界面"""
         # 保存最近的搜索查询
         self.last_search_query = query
 
         # 清空匹配列表
-        # self.match_list.delete(0, tk.END)
-        # 改为这个
-        for item in self.match_list.get_children():
-            self.match_list.delete(item)
+        self.match_list.delete(*self.match_list.get_children())
 
         if not query or not self.knowledge_base:
             return
@@ -4494,82 +5045,127 @@ class KnowledgeNavigator:
         # 更新状态
         self.status_bar.config(text="正在搜索...")
 
-        # 从查询中提取关键词 - 这个过程可能耗时，所以我们添加进度指示
-        keywords = self.extract_keywords(query)
+        # 界面变量只能在主线程读取
+        use_fuzzy = self.fuzzy_match_var.get()
+        fuzzy_threshold = self.fuzzy_ratio
 
-        if not keywords:
-            self.status_bar.config(text="未找到有效的搜索关键词")
-            return
+        # 只有最后一次提交的搜索结果会显示
+        self._search_seq += 1
+        seq = self._search_seq
 
-        # 搜索结果
-        matches = []
+        # 上一次搜索如果还在排队就不必再算了，其结果也不会显示
+        if self._search_future:
+            self._search_future.cancel()
 
-        # 检查是否启用模糊匹配
-        use_fuzzy = self.fuzzy_match_var.get()
-        fuzzy_threshold = self.fuzzy_ratio
+        # 知识库文本、标题索引和版本在主线程中一起取出，后台计算只使用这份快照
+        kb_version = self._kb_version
+        future = self._search_future = self._search_exec.submit(
+            self._compute_search, query, use_fuzzy, fuzzy_threshold, self.knowledge_base, kb_version, self._h_index)
+        future.add_done_callback(lambda f: self._on_search_done(f, seq, kb_version, on_done))
 
-        # 如果这是一个完全匹配的标签，我们可以直接从缓存中获取结果（如果有）
-        cache_key = f"{query}_{use_fuzzy}_{fuzzy_threshold}"
-        if hasattr(self, 'search_cache') and cache_key in self.search_cache:
-            self.current_matches = self.search_cache[cache_key]
-            self._update_match_list(self.current_matches, query)
-            self.status_bar.config(
-                text=f"搜索完成(从缓存): 找到 {len(self.current_matches)} 个匹配 ({time.time() - start_time:.2f}秒)")
+    def _on_search_done(self, future, seq, kb_version, on_done):
+        """搜索任务结束（在后台线程中调用），窗口未关闭时交给主线程显示结果"""
+        if self._closing:
             return
+        try:
+            self.root.after(0, self._apply_search_result, future, seq, kb_version, on_done)
+        except (tk.TclError, RuntimeError):
+            # 窗口恰好在此时销毁
+            pass
+
+    def _compute_search(self, query, use_fuzzy, fuzzy_threshold, text, kb_version, index):
+        """后台线程中执行的搜索计算，不访问任何界面组件"""
+        start_time = time.time()  # 计时开始
+        result = {'query': query, 'kb_version': kb_version, 'matches': None,
+                  'pattern': None, 'from_cache': False}
+
+        # 重复的查询（如反复点击标签）直接从缓存中获取结果，连关键词提取也省掉
+        cache_key = (query.casefold(), use_fuzzy, fuzzy_threshold, kb_version)
+        if cache_key in self.search_cache:
+            self.search_cache.move_to_end(cache_key)
+            matches = self.search_cache[cache_key]
+            result['from_cache'] = True
+        else:
+            # 从查询中提取关键词
+            keywords = self.extract_keywords(query)
+            if not keywords:
+                return result
+
+            # 首先在标题中搜索（优先匹配标题）- 使用更高效的方法
+            matches = self._search_in_headings(keywords, use_fuzzy, fuzzy_threshold, index)
 
-        # 首先在标题中搜索（优先匹配标题）- 使用更高效的方法
-        heading_matches = self._search_in_headings(keywords, use_fuzzy, fuzzy_threshold)
-        matches.extend(heading_matches)
+            # 如果标题匹配不够，在内容中搜索
+            if len(matches) < 10:
+                matches.extend(self._search_in_content(keywords, use_fuzzy, fuzzy_threshold, text, kb_version, index))
 
-        # 如果标题匹配不够，在内容中搜索
-        if len(matches) < 10:
-            content_matches = self._search_in_content(keywords, use_fuzzy, fuzzy_threshold)
-            matches.extend(content_matches)
+            # 按匹配分数排序
+            matches.sort(key=lambda x: x['score'], reverse=True)
 
-        # 按匹配分数排序
-        matches.sort(key=lambda x: x['score'], reverse=True)
+            # 限制显示的匹配数量
+            max_matches = 30
+            if len(matches) > max_matches:
+                matches = matches[:max_matches]
 
-        # 限制显示的匹配数量
-        max_matches = 30
-        if len(matches) > max_matches:
-            matches = matches[:max_matches]
+            # 缓存结果以提高性能，超出上限时淘汰最久未使用的项
+            self.search_cache[cache_key] = matches.copy()
+            if len(self.search_cache) > self.max_search_cache:
+                self.search_cache.popitem(last=False)
 
-        # 更新匹配列表UI
-        self._update_match_list(matches, query)
+        result['matches'] = matches
+        result['pattern'] = self._get_highlight_pattern(query)
+        result['elapsed'] = time.time() - start_time
+        return result
 
-        # 高亮显示匹配项
-        self.highlight_search_matches(query, matches)
+    def _apply_search_result(self, future, seq, kb_version, on_done=None):
+        """在主线程中显示搜索结果"""
+        # 已经有更新的搜索，或者知识库已经切换，丢弃这次结果（包括其中的异常）
+        if seq != self._search_seq or kb_version != self._kb_version:
+            return
 
-        # 更新状态
-        match_count = len(matches)
-        search_time = time.time() - start_time
-        self.status_bar.config(text=f"搜索完成: 找到 {match_count} 个匹配 ({search_time:.2f}秒)")
+        try:
+            result = future.result()
+        except Exception as e:
+            self.status_bar.config(text=f"搜索出错: {type(e).__name__}: {e}")
+            return
+
+        query = result['query']
+        matches = result['matches']
+        if matches is None:
+            self.status_bar.config(text="未找到有效的搜索关键词")
+            return
 
         # 保存匹配结果供后续使用
         self.current_matches = matches
 
-        # 缓存结果以提高性能
-        if not hasattr(self, 'search_cache'):
-            self.search_cache = {}
-        if len(self.search_cache) > 20:  # 限制缓存大小
-            # 删除最早的缓存项
-            oldest_key = next(iter(self.search_cache))
-            del self.search_cache[oldest_key]
-        self.search_cache[cache_key] = matches.copy()
+        # 更新匹配列表UI
+        self._update_match_list(matches, query)
 
-        # 如果没有匹配项，显示提示
+        # 高亮显示匹配项
+        self.highlight_search_matches(query, matches, result['pattern'])
+
+        # 更新状态
         if not matches:
             self.status_bar.config(text=f"搜索结果：没有找到与'{query}'匹配的内容")
+        elif result['from_cache']:
+            self.status_bar.config(
+                text=f"搜索完成(从缓存): 找到 {len(matches)} 个匹配 ({result['elapsed']:.2f}秒)")
+        else:
+            self.status_bar.config(text=f"搜索完成: 找到 {len(matches)} 个匹配 ({result['elapsed']:.2f}秒)")
 
-    def _search_in_headings(self, keywords, use_fuzzy, fuzzy_threshold):
-        """在标题中搜索关键词 """
+        if on_done:
+            on_done()
+
+    def _search_in_headings(self, keywords, use_fuzzy, fuzzy_threshold, index=None):
+        """在标题中搜索关键词，后台线程须传入提交搜索时的标题索引"""
         matches = []
+        index = index or self._h_index
 
         # 预先创建匹配函数以避免循环中重复逻辑
-        def check_match(keyword, heading_text):
+        def check_match(keyword, heading_text, ratio=None):
             if use_fuzzy:
                 try:
-                    ratio = difflib.SequenceMatcher(None, keyword, heading_text).ratio() * 100
+                    if ratio is None:
+                        ratio = _similarity(keyword, heading_text, fuzzy_threshold)
                     if ratio >= fuzzy_threshold:
                         return ratio / 100 + 1  # 更高比率给更高分数
                     elif keyword in heading_text:
@@ -4583,16 +5179,22 @@ class KnowledgeNavigator:
                 # 精确匹配
                 return 1 if keyword in heading_text else 0
 
-        # 优化处理：将标题文本预先转换为小写以避免循环内重复转换
-        lowercase_headings = [(i, heading['text'].lower()) for i, heading in enumerate(self.heading_positions)]
+        # 优化处理：直接使用解析时预先转换的小写标题
+        lowercase_headings = list(enumerate(index.normalized))
 
         # 对每个关键词，找到所有匹配的标题
         for keyword in keywords:
             keyword_lower = keyword.lower()
+            if use_fuzzy:
+                ratios = self._fuzzy_heading_ratios(keyword_lower, fuzzy_threshold, index)
+                scored = ((idx, check_match(keyword_lower, heading_text, ratios[idx] if ratios is not None else None))
+                          for idx, heading_text in lowercase_headings)
+            else:
+                # 精确匹配通过字符倒排表只检查可能包含关键词的标题
+                scored = ((idx, 1) for idx in self._headings_containing(keyword_lower, index))
 
-            for idx, heading_text in lowercase_headings:
-                heading = self.heading_positions[idx]
-                match_score = check_match(keyword_lower, heading_text)
+            for idx, match_score in scored:
+                heading = index.headings[idx]
 
                 # 确保match_score不是None
                 if match_score is None:
@@ -4618,63 +5220,61 @@ class KnowledgeNavigator:
                         })
 
         return matches
-    def _search_in_content(self, keywords, use_fuzzy, fuzzy_threshold):
+    def _search_in_content(self, keywords, use_fuzzy, fuzzy_threshold, text=None, kb_version=None, index=None):
         """在内容中搜索关键词 - 分离为单独方法以提高代码清晰度"""
         matches = []
+        if text is None:
+            text, kb_version, index = self.knowledge_base, self._kb_version, self._h_index
 
-        # 将文档分成段落并预处理
-        paragraphs = re.split(r'\n\s*\n', self.knowledge_base)
-        processed_paragraphs = []
+        # 段落在每次加载知识库后只切分一次
+        processed_paragraphs = self._split_paragraphs(text, kb_version)[0]
 
-        # 预处理段落内容，记录它们在文档中的位置
-        for para_idx, paragraph in enumerate(paragraphs):
-            if not paragraph.strip():
-                continue
+        # 只对较短的段落使用模糊匹配，较长的段落以空串代替
+        fuzzy_texts = None
+        if use_fuzzy and RAPIDFUZZ_AVAILABLE:
+            fuzzy_texts = [para['lower_text'] if para['length'] < 500 else ''
+                           for para in processed_paragraphs]
 
-            # 查找段落在原始文本中的位置（只对第一个段落特殊处理，提升性能）
-            if para_idx == 0:
-                para_pos = 0
-            else:
-                para_pos = self.knowledge_base.find(paragraph)
-
-            # 预处理并存储
-            processed_paragraphs.append({
-                'text': paragraph,
-                'lower_text': paragraph.lower(),  # 预先转换为小写
-                'position': para_pos,
-                'length': len(paragraph)
-            })
+        # 已匹配的段落下标 -> 匹配项
+        matches_by_para = {}
+
+        # 模糊匹配要检查所有段落，每个段落只扫描一遍，得到其中包含的所有关键词
+        contained = None
+        if use_fuzzy:
+            contained = _keywords_in_texts(keywords, [para['lower_text'] for para in processed_paragraphs])
 
         # 对于每个关键词，在所有段落中查找
         for keyword in keywords:
             keyword_lower = keyword.lower()
+            ratios = _fuzzy_ratios(keyword_lower, fuzzy_texts, fuzzy_threshold) if fuzzy_texts else None
+
+            # 精确匹配时只需检查包含该关键词的段落
+            candidates = None if use_fuzzy else self._paragraphs_containing(keyword_lower, text, kb_version)
+            if candidates is None:
+                candidates = range(len(processed_paragraphs))
 
-            for para in processed_paragraphs:
+            for para_idx in candidates:
+                para = processed_paragraphs[para_idx]
                 para_text = para['lower_text']
                 para_score = 0
 
                 # 快速检查关键词是否在段落中
-                if keyword_lower in para_text:
+                if (keyword_lower in contained[para_idx]) if contained is not None else (keyword_lower in para_text):
                     para_score = 1
                 elif use_fuzzy and len(para['text']) < 500:  # 只对较短的段落使用模糊匹配
                     try:
-                        ratio = difflib.SequenceMatcher(None, keyword_lower, para_text).ratio() * 100
+                        if ratios is not None:
+                            ratio = ratios[para_idx]
+                        else:
+                            ratio = _similarity(keyword_lower, para_text, fuzzy_threshold)
                         if ratio >= fuzzy_threshold:
                             para_score = 0.5 + (ratio / 200)  # 权重低于直接匹配
                     except:
                         pass
 
                 if para_score > 0:
-                    # 查找最近的标题
-                    nearest_heading = self._find_nearest_heading(para['position'])
-                    heading_text = nearest_heading['text'] if nearest_heading else "无标题区域"
-
-                    # 创建摘要
-                    snippet = self._create_snippet(para['text'], keyword_lower)
-
                     # 检查是否已添加此段落
-                    existing_match = next((m for m in matches
-                                           if m['position'] == para['position'] and m['type'] == 'content'), None)
+                    existing_match = matches_by_para.get(para_idx)
 
                     if existing_match:
                         # 更新现有匹配
@@ -4682,43 +5282,94 @@ class KnowledgeNavigator:
                         if keyword not in existing_match['keywords']:
                             existing_match['keywords'].append(keyword)
                     else:
+                        # 查找最近的标题，只有新匹配才需要标题和摘要
+                        nearest_heading = self._find_nearest_heading(para['position'], index)
+                        heading_text = nearest_heading['text'] if nearest_heading else "无标题区域"
+
+                        # 创建摘要，直接使用预先转换的小写段落
+                        snippet = self._create_snippet(para['text'], keyword_lower, para_text)
+
                         # 添加新匹配
-                        matches.append({
+                        match = {
                             'text': f"{heading_text} - {snippet}",
                             'position': para['position'],
                             'score': para_score,
                             'type': 'content',
                             'keywords': [keyword]
-                        })
+                        }
+                        matches.append(match)
+                        matches_by_para[para_idx] = match
 
         return matches
 
-    def _find_nearest_heading(self, position):
-        """查找给定位置前最近的标题 - 辅助函数"""
-        nearest_heading = None
-        nearest_distance = float('inf')
+    def _split_paragraphs(self, text, kb_version):
+        """把知识库文本切分成段落并预处理，返回(段落, 各段落起始位置)，同一版本复用上次的结果"""
+        version, paragraphs, starts = self._paragraph_cache
+        if version == kb_version:
+            return paragraphs, starts
+
+        paragraphs = []
+
+        # 从分隔符的位置直接得到每个段落在原文中的起始位置
+        start = 0
+        for sep in chain(_PARAGRAPH_SEP_RE.finditer(text), (None,)):
+            end = sep.start() if sep else len(text)
+            paragraph = text[start:end]
+            if paragraph.strip():
+                paragraphs.append({
+                    'text': paragraph,
+                    'lower_text': paragraph.lower(),  # 预先转换为小写
+                    'position': start,
+                    'length': len(paragraph)
+                })
+            if sep:
+                start = sep.end()
+
+        starts = array('q', (para['position'] for para in paragraphs))
+        self._paragraph_cache = (kb_version, paragraphs, starts)
+        return paragraphs, starts
 
-        # 首先尝试查找位置之前的最近标题
-        for heading in self.heading_positions:
-            if heading['position'] <= position:
-                distance = position - heading['position']
-                if distance < nearest_distance:
-                    nearest_distance = distance
-                    nearest_heading = heading
+    def _paragraphs_containing(self, keyword, text, kb_version):
+        """在小写全文中查找关键词，返回包含它的段落下标（升序），无法按位置对应时返回None"""
+        kb_lower = self._lowercase_knowledge_base(text, kb_version)
+        # 个别字符转小写后长度会变，此时位置无法与原文对应
+        if not keyword or len(kb_lower) != len(text):
+            return None
+
+        paragraphs, starts = self._split_paragraphs(text, kb_version)
+        result = []
+        pos = kb_lower.find(keyword)
+        while pos >= 0:
+            i = bisect.bisect_right(starts, pos) - 1
+            para_end = paragraphs[i]['position'] + paragraphs[i]['length'] if i >= 0 else 0
+            if i >= 0 and pos + len(keyword) <= para_end:
+                # 找到后直接跳到段落末尾继续查找
+                result.append(i)
+                pos = kb_lower.find(keyword, para_end)
+            else:
+                # 落在段落之间的空白中，或跨越了段落边界
+                pos = kb_lower.find(keyword, pos + 1)
+        return result
 
-        # 如果找不到前面的标题，尝试查找之后的最近标题
-        if nearest_heading is None and self.heading_positions:
-            nearest_heading = min(self.heading_positions, key=lambda h: abs(h['position'] - position))
+    def _find_nearest_heading(self, position, index=None):
+        """查找给定位置前最近的标题 - 辅助函数"""
+        index = index or self._h_index
+        if not index.positions:
+            return None
 
-        return nearest_heading
+        # 首先尝试查找位置之前的最近标题，找不到时之后最近的就是第一个标题
+        i = self.heading_at(position, index.positions)
+        return index.headings[max(i, 0)]
 
-    def _create_snippet(self, paragraph, keyword):
-        """为段落创建包含关键词的摘要 - 辅助函数"""
+    def _create_snippet(self, paragraph, keyword, lower_paragraph=None):
+        """为段落创建包含关键词的摘要 - 辅助函数，可传入已转换的小写段落"""
         if len(paragraph) <= 100:
             return paragraph
 
         # 查找关键词的位置
-        keyword_pos = paragraph.lower().find(keyword)
+        if lower_paragraph is None:
+            lower_paragraph = paragraph.lower()
+        keyword_pos = lower_paragraph.find(keyword)
 
         if keyword_pos >= 0:
             # 创建以关键词为中心的摘要
@@ -4741,8 +5392,7 @@ class KnowledgeNavigator:
     def _update_match_list(self, matches, query):
         """更新匹配列表UI - 分组显示优化版"""
         # 清空之前的匹配
-        for item in self.match_list.get_children():
-            self.match_list.delete(item)
+        self.match_list.delete(*self.match_list.get_children())
 
         # 按类型分组匹配结果
         heading_matches = [m for m in matches if m['type'] == 'heading']
@@ -4764,11 +5414,8 @@ class KnowledgeNavigator:
                 relevance = min(100, int(match['score'] * 20))
 
                 # 获取标题级别用于缩进
-                level = 1
-                for h in self.heading_positions:
-                    if h['position'] == match['position']:
-                        level = h.get('level', 1)
-                        break
+                h = self._heading_index_at(match['position'])
+                level = self._h_levels[h] if h >= 0 else 1
 
                 # 创建缩进字符串
                 indent = "  " * (level - 1) if level > 1 else ""
@@ -4883,270 +5530,41 @@ class KnowledgeNavigator:
         # 获取选中的匹配项
         match = self.current_matches[match_index]
         position = match['position']
-        match_text = match['text']
-        match_keywords = match.get('keywords', [])
         match_type = match['type']
 
+        # 内容匹配定位到段落中第一次出现关键词的地方
+        if match_type == 'content':
+            position = self._first_keyword_position(position, match.get('keywords', []))
+
         # 判断是否为Markdown文件
         is_markdown = self.knowledge_path and self.knowledge_path.lower().endswith('.md')
 
-        if is_markdown:
-            # 多种匹配策略
-            matched = False
-
-            # 1. 如果是标题匹配，尝试查找确切的标题
+        # Markdown渲染时已记录原文每一行对应的显示行，直接查表定位，无需在文本控件中搜索
+        mark_position = self._rendered_index(position) if is_markdown else None
+        if mark_position:
+            # 标题高亮该行及其下方几行，内容高亮当前行和周围几行
+            line_num = int(mark_position.split('.')[0])
             if match_type == 'heading':
-                heading_text = match_text
-
-                # 先尝试在渲染后的文本中查找确切的标题
-                start_pos = self.content_text.search(heading_text, "1.0", stopindex=tk.END, exact=True)
-                if start_pos:
-                    # 检查是否是真正的标题（不是正文中的相同文本）
-                    tags_at_pos = self.content_text.tag_names(start_pos)
-                    heading_tags = [tag for tag in tags_at_pos if tag.startswith('h')]
-
-                    if heading_tags:  # 如果有h1, h2等标题标签
-                        self.content_text.see(start_pos)
-
-                        # 清除之前的高亮
-                        self.content_text.config(state=tk.NORMAL)
-                        self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                        # 高亮该标题行及其下方几行
-                        line_num = int(start_pos.split('.')[0])
-                        for i in range(0, 5):  # 当前行和后4行
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"  # 当前行亮黄色
-                                    else:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except:
-                                    pass
-
-                        self.content_text.config(state=tk.DISABLED)
-
-                        # 高亮目录中的相应项目
-                        self.highlight_toc_for_position(position)
-                        matched = True
-
-            # 2. 如果是内容匹配，尝试使用关键词定位
-            if not matched and match_keywords:
-                # 按长度排序关键词，优先使用较长的关键词
-                sorted_keywords = sorted(match_keywords, key=len, reverse=True)
-
-                for keyword in sorted_keywords:
-                    if len(keyword) < 3:  # 忽略太短的关键词
-                        continue
-
-                    # 查找关键词
-                    pos = self.content_text.search(keyword, "1.0", stopindex=tk.END)
-                    if pos:
-                        self.content_text.see(pos)
-
-                        # 清除之前的高亮
-                        self.content_text.config(state=tk.NORMAL)
-                        self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                        # 高亮当前行和周围几行
-                        line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):  # 前1行和后4行
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"  # 当前行亮黄色
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"  # 前一行浅黄色
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except:
-                                    pass
-
-                        self.content_text.config(state=tk.DISABLED)
-                        matched = True
-                        break
-
-            # 3. 尝试使用匹配文本的前半部分（通常是标题部分）
-            if not matched and ' - ' in match_text:
-                title_part = match_text.split(' - ')[0].strip()
-                if len(title_part) > 3:  # 确保足够长以减少误匹配
-                    pos = self.content_text.search(title_part, "1.0", stopindex=tk.END)
-                    if pos:
-                        self.content_text.see(pos)
-
-                        # 清除之前的高亮
-                        self.content_text.config(state=tk.NORMAL)
-                        self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                        # 高亮当前行和周围几行
-                        line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except:
-                                    pass
-
-                        self.content_text.config(state=tk.DISABLED)
-                        matched = True
-
-            # 4. 如果以上策略都失败，尝试提取上下文并搜索
-            if not matched:
-                # 打印调试信息
-                print(f"Using fallback content search for {match_text[:30]}...")
-
-                # 提取原始位置附近的上下文
-                context_start = max(0, position - 50)  # 扩大上下文范围
-                context_end = min(len(self.knowledge_base), position + 50)
-                context = self.knowledge_base[context_start:context_end]
-
-                # 打印上下文的一部分
-                print(f"Context snippet: {context[:100].replace(chr(10), ' ')}...")
-
-                # 尝试找到上下文中的一些独特词语 - 改进正则表达式以匹配更多单词
-                # 包括英文单词、数字以及中文字符
-                words = re.findall(r'[\w\u4e00-\u9fff]{3,}', context)
-                words.sort(key=len, reverse=True)
-
-                search_terms = []
-                for word in words:
-                    if word not in search_terms and len(word) > 3:  # 降低长度要求
-                        search_terms.append(word)
-                        if len(search_terms) >= 8:  # 增加搜索词数量
-                            break
-
-                print(f"Search terms: {search_terms}")
-
-                # 尝试使用这些词定位
-                for term in search_terms:
-                    pos = self.content_text.search(term, "1.0", stopindex=tk.END)
-                    if pos:
-                        self.content_text.see(pos)
-
-                        # 清除之前的高亮
-                        self.content_text.config(state=tk.NORMAL)
-                        self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                        # 高亮当前行和周围几行
-                        line_num = int(pos.split('.')[0])
-                        for i in range(-1, 5):
-                            curr_line = line_num + i
-                            if curr_line > 0:
-                                line_start = f"{curr_line}.0"
-                                try:
-                                    line_end = f"{curr_line}.end"
-
-                                    if i == 0:
-                                        highlight_color = "yellow"
-                                    elif i > 0:
-                                        intensity = max(204, 255 - (i * 10))
-                                        highlight_color = f"#FFFF{intensity:02X}"
-                                    else:
-                                        highlight_color = "#FFFFDD"
-
-                                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                                except:
-                                    pass
-
-                        self.content_text.config(state=tk.DISABLED)
-                        matched = True
-                        break
-
-            # 如果所有尝试都失败，尝试一个更直接的方法：直接跳转到原始位置并附近查找
-            if not matched:
-                print("All matching strategies failed, trying direct position scroll")
-
-                # 直接使用原始位置跳转
-                line_number = self.knowledge_base.count('\n', 0, position) + 1
-                mark_position = f"{line_number}.0"
-
-                # 尝试计算一个更精确的位置
-                try:
-                    # 获取原始位置所在行的内容
-                    line_start = position - self.knowledge_base.rfind('\n', 0, position) - 1
-                    line_content = self.knowledge_base[position:position + 50].split('\n')[0]
-                    print(f"Line content at position: {line_content}")
-
-                    # 尝试在文本框中找到这行内容
-                    if len(line_content) > 5:  # 确保内容足够长
-                        pos = self.content_text.search(line_content[:20], "1.0", stopindex=tk.END)
-                        if pos:
-                            print(f"Found content match at {pos}")
-                            mark_position = pos
-                except Exception as e:
-                    print(f"Error calculating precise position: {e}")
-
-                self.content_text.config(state=tk.NORMAL)
-                self.content_text.see(mark_position)
-
-                # 清除之前的高亮
-                self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                # 高亮当前行和周围几行
-                line_num = int(mark_position.split('.')[0])
-                for i in range(-2, 6):  # 增加高亮范围: 前2行和后5行
-                    curr_line = line_num + i
-                    if curr_line > 0:
-                        line_start = f"{curr_line}.0"
-                        try:
-                            line_end = f"{curr_line}.end"
-
-                            if i == 0:
-                                highlight_color = "yellow"  # 当前行亮黄色
-                            elif i > 0:
-                                intensity = max(204, 255 - (i * 10))
-                                highlight_color = f"#FFFF{intensity:02X}"
-                            else:
-                                highlight_color = "#FFFFDD"  # 前面的行浅黄色
-
-                            self.content_text.tag_add("position_highlight", line_start, line_end)
-                            self.content_text.tag_config("position_highlight", background=highlight_color)
-                        except Exception as e:
-                            print(f"Error highlighting line {curr_line}: {e}")
-
-                self.content_text.config(state=tk.DISABLED)
-
-                # 如果这是一个标题，同时高亮目录中的相应项目
-                if match_type == 'heading':
-                    self.highlight_toc_for_position(position)
+                self._schedule_jump(mark_position, line_num, before=0)
+            else:
+                self._schedule_jump(mark_position, line_num)
         else:
             # 非Markdown文件使用原始方法
-            print("Non-markdown file, using direct position scroll")
             self.scroll_to_position(position)
 
-            # 如果这是一个标题，同时高亮目录中的相应项目
-            if match_type == 'heading':
-                self.highlight_toc_for_position(position)
+        # 同时高亮目录中的相应项目，内容匹配高亮其所在章节
+        self.highlight_toc_for_position(match['position'])
+
+    def _first_keyword_position(self, position, keywords):
+        """返回从position开始的段落中最早出现的关键词位置，找不到时返回position"""
+        sep = _PARAGRAPH_SEP_RE.search(self.knowledge_base, position)
+        end = sep.start() if sep else len(self.knowledge_base)
+        kb_lower = self._lowercase_knowledge_base()
+
+        found = [kb_lower.find(keyword.lower(), position, end) for keyword in keywords if keyword]
+        found = [pos for pos in found if pos >= 0]
+        return min(found) if found else position
+
     def on_toc_select(self, event):
 
         """处理目录项选择事件"""
@@ -5157,6 +5575,11 @@ class KnowledgeNavigator:
         item_id = selected_items[0]
 
         # 获取存储在树项目中的位置值
+        # 同步目录时触发的选择事件，内容已经定位过
+        if item_id == self._toc_sync_item:
+            self._toc_sync_item = None
+            return
+
         values = self.toc_tree.item(item_id, 'values')
         if not values:
             return
@@ -5167,333 +5590,184 @@ class KnowledgeNavigator:
         self.scroll_to_position(int(position))
 
     def highlight_toc_for_position(self, position):
-        """高亮对应位置的目录项"""
-
-        # 查找该位置的目录项，使用递归方法而不是一次性获取所有子节点
-        def search_toc_items(parent=''):
-            for item_id in self.toc_tree.get_children(parent):
-                values = self.toc_tree.item(item_id, 'values')
-                if values and int(values[0]) == position:
-                    # 选中此项
-                    self.toc_tree.selection_set(item_id)
-                    self.toc_tree.see(item_id)
-                    return True
-
-                # 递归搜索子项
-                if search_toc_items(item_id):
-                    return True
-            return False
+        """高亮对应位置的目录项，位置不是标题时高亮其所在章节"""
+        i = self.heading_at(position)
+        if i < 0:
+            return
 
-        search_toc_items()
+        # 目录节点可能尚未插入，先补全其祖先节点
+        item_id = self._ensure_toc_item(i)
+        if item_id:
+            # 已经选中时不再selection_set：Tk仍会发出选择事件，on_toc_select会跳回章节标题
+            if self.toc_tree.selection() != (item_id,):
+                # 选中此项触发的on_toc_select不必再次跳转
+                self._toc_sync_item = item_id
+                self.toc_tree.selection_set(item_id)
+            self.toc_tree.see(item_id)
 
     def scroll_to_position(self, position):
         """滚动内容到指定位置，支持Markdown渲染"""
         is_markdown = self.knowledge_path and self.knowledge_path.lower().endswith('.md')
 
-        if is_markdown:
-            # 检查是否有位置映射
-            if hasattr(self, 'position_mapping') and position in self.position_mapping:
-                # 直接使用映射的位置
-                mark_position = self.position_mapping[position]
-                self.content_text.config(state=tk.NORMAL)
-                self.content_text.mark_set(tk.INSERT, mark_position)
-                self.content_text.see(mark_position)
-
-                # 计算行号以进行高亮
-                line_num = int(mark_position.split('.')[0])
-
-                # 清除之前的高亮
-                self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                # 高亮显示当前行和周围几行
-                for i in range(-1, 5):  # 前1行和后4行
-                    curr_line = line_num + i
-                    if curr_line > 0:
-                        line_start = f"{curr_line}.0"
-                        try:
-                            line_end = f"{curr_line}.end"
-
-                            if i == 0:
-                                highlight_color = "yellow"  # 当前行亮黄色
-                            elif i > 0:
-                                intensity = max(204, 255 - (i * 10))
-                                highlight_color = f"#FFFF{intensity:02X}"
-                            else:
-                                highlight_color = "#FFFFDD"  # 前一行浅黄色
-
-                            self.content_text.tag_add("position_highlight", line_start, line_end)
-                            self.content_text.tag_config("position_highlight", background=highlight_color)
-                        except:
-                            pass
-
-                self.content_text.config(state=tk.DISABLED)
-                return
-
-            # 查找最接近该位置的标题
-            nearest_heading = None
-            nearest_distance = float('inf')
-
-            for heading in self.heading_positions:
-                if heading['position'] <= position:
-                    distance = position - heading['position']
-                    if distance < nearest_distance:
-                        nearest_distance = distance
-                        nearest_heading = heading
-
-            if nearest_heading and hasattr(nearest_heading, 'rendered_position') and nearest_heading[
-                'rendered_position']:
-                # 使用渲染后的位置
-                mark_position = nearest_heading['rendered_position']
-                self.content_text.config(state=tk.NORMAL)
-                self.content_text.mark_set(tk.INSERT, mark_position)
-                self.content_text.see(mark_position)
-
-                # 计算行号以进行高亮
-                line_num = int(mark_position.split('.')[0])
-
-                # 清除之前的高亮
-                self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                # 高亮显示当前行和周围几行
-                for i in range(-1, 5):  # 前1行和后4行
-                    curr_line = line_num + i
-                    if curr_line > 0:
-                        line_start = f"{curr_line}.0"
-                        try:
-                            line_end = f"{curr_line}.end"
-
-                            if i == 0:
-                                highlight_color = "yellow"  # 当前行亮黄色
-                            elif i > 0:
-                                intensity = max(204, 255 - (i * 10))
-                                highlight_color = f"#FFFF{intensity:02X}"
-                            else:
-                                highlight_color = "#FFFFDD"  # 前一行浅黄色
-
-                            self.content_text.tag_add("position_highlight", line_start, line_end)
-                            self.content_text.tag_config("position_highlight", background=highlight_color)
-                        except:
-                            pass
-
-                self.content_text.config(state=tk.DISABLED)
-                return
-
-            # 如果找不到精确映射，尝试上下文匹配
-            # 提取原始位置附近的上下文
-            context_start = max(0, position - 30)
-            context_end = min(len(self.knowledge_base), position + 30)
-            context = self.knowledge_base[context_start:context_end]
-
-            # 尝试找到上下文中的一些独特词语进行搜索
-            words = re.findall(r'\b\w{4,}\b', context)  # 提取4个字符以上的词
-            search_terms = []
-
-            # 按长度排序，优先使用较长的词
-            words.sort(key=len, reverse=True)
+        # Markdown渲染后行号会变化，使用渲染时记录的行号表；其他文件与原文行号一致
+        mark_position = self._rendered_index(position) if is_markdown else None
+        if mark_position:
+            line_number = int(mark_position.split('.')[0])
+        else:
+            line_number = self._line_col(position)[0]
+            mark_position = f"{line_number}.0"
 
-            # 选取前5个不同的词
-            for word in words:
-                if word not in search_terms and len(word) > 4:
-                    search_terms.append(word)
-                    if len(search_terms) >= 5:
-                        break
+        # 滚动到该位置并高亮显示当前行和周围几行
+        self._schedule_jump(mark_position, line_number)
 
-            # 尝试使用这些词定位
-            for term in search_terms:
-                pos = self.content_text.search(term, "1.0", stopindex=tk.END)
-                if pos:
-                    self.content_text.config(state=tk.NORMAL)
-                    self.content_text.mark_set(tk.INSERT, pos)
-                    self.content_text.see(pos)
-
-                    # 计算行号以进行高亮
-                    line_num = int(pos.split('.')[0])
-
-                    # 清除之前的高亮
-                    self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-                    # 高亮显示当前行和周围几行
-                    for i in range(-1, 5):  # 前1行和后4行
-                        curr_line = line_num + i
-                        if curr_line > 0:
-                            line_start = f"{curr_line}.0"
-                            try:
-                                line_end = f"{curr_line}.end"
-
-                                if i == 0:
-                                    highlight_color = "yellow"  # 当前行亮黄色
-                                elif i > 0:
-                                    intensity = max(204, 255 - (i * 10))
-                                    highlight_color = f"#FFFF{intensity:02X}"
-                                else:
-                                    highlight_color = "#FFFFDD"  # 前一行浅黄色
-
-                                self.content_text.tag_add("position_highlight", line_start, line_end)
-                                self.content_text.tag_config("position_highlight", background=highlight_color)
-                            except:
-                                pass
-
-                    self.content_text.config(state=tk.DISABLED)
-                    return
+    def _schedule_jump(self, mark_position, line_num, before=1, after=4):
+        """稍后滚动并高亮，连续快速跳转时只执行最后一次"""
+        if self._pending_jump:
+            self.root.after_cancel(self._pending_jump)
+        self._pending_jump = self.root.after(50, self._do_jump, mark_position, line_num, before, after)
 
-        # 默认处理方法（非Markdown或搜索失败）
-        line_number = self.knowledge_base.count('\n', 0, position) + 1
+    def _do_jump(self, mark_position, line_num, before, after):
+        """滚动内容到mark_position并高亮附近的行"""
+        self._pending_jump = None
 
-        # 设置标记以滚动到该位置
-        mark_position = f"{line_number}.0"
-        self.content_text.config(state=tk.NORMAL)
+        # 标记和标签在只读状态下也能修改，不必切换state
         self.content_text.mark_set(tk.INSERT, mark_position)
         self.content_text.see(mark_position)
+        self._highlight_lines(line_num, before, after)
 
-        # 清除之前的高亮
-        self.content_text.tag_remove("position_highlight", "1.0", tk.END)
-
-        # 高亮显示当前行和周围几行
-        for i in range(-1, 5):  # 前1行和后4行
-            curr_line = line_number + i
-            if curr_line > 0:
-                line_start = f"{curr_line}.0"
-                try:
-                    line_end = f"{curr_line}.end"
-
-                    if i == 0:
-                        highlight_color = "yellow"  # 当前行亮黄色
-                    elif i > 0:
-                        intensity = max(204, 255 - (i * 10))
-                        highlight_color = f"#FFFF{intensity:02X}"
-                    else:
-                        highlight_color = "#FFFFDD"  # 前一行浅黄色
+    @contextmanager
+    def _editable(self):
+        """临时允许修改内容区，退出时恢复只读"""
+        self.content_text.config(state=tk.NORMAL)
+        try:
+            yield self.content_text
+        finally:
+            self.content_text.config(state=tk.DISABLED)
 
-                    self.content_text.tag_add("position_highlight", line_start, line_end)
-                    self.content_text.tag_config("position_highlight", background=highlight_color)
-                except:
-                    pass
+    def _highlight_lines(self, line_num, before=1, after=4):
+        """高亮第line_num行及其前before行、后after行，每种颜色只调用一次tag_add"""
+        for tag in _POSITION_HIGHLIGHT_TAGS:
+            self.content_text.tag_remove(tag, "1.0", tk.END)
 
-        self.content_text.config(state=tk.DISABLED)
+        last_line = self._last_line
+        if last_line is None:
+            last_line = self._last_line = int(self.content_text.index('end-1c').split('.')[0])
 
-    def find_content_by_context(self, original_position, context_length=50):
-        """通过上下文找到渲染后的文本位置"""
+        ranges = {}
+        for offset in range(-before, after + 1):
+            curr_line = line_num + offset
+            if not 0 < curr_line <= last_line:
+                continue
+            if offset == 0:
+                tag = "position_highlight"
+            elif offset < 0:
+                tag = "position_highlight_before"
+            else:
+                tag = _POSITION_AFTER_TAGS[min(offset, 5) - 1]
+            ranges.setdefault(tag, []).extend((f"{curr_line}.0", f"{curr_line}.end"))
+
+        for tag, tag_ranges in ranges.items():
+            self.content_text.tag_add(tag, *tag_ranges)
+
+    def find_content_by_context(self, original_position, context_length=50, approx_line=None, window=200):
+        """通过上下文找到渲染后的文本位置，先在预计所在行附近搜索，结果按参数缓存"""
+        key = (original_position, context_length, approx_line, window)
+        if key in self._ctx_cache:
+            self._ctx_cache.move_to_end(key)
+            return self._ctx_cache[key]
+
+        pos = self._locate_by_context(original_position, context_length, approx_line, window)
+        self._ctx_cache[key] = pos
+        if len(self._ctx_cache) > 256:
+            self._ctx_cache.popitem(last=False)
+        return pos
+
+    def _locate_by_context(self, original_position, context_length, approx_line, window):
+        """在渲染后的文本中搜索原文上下文里的锚点"""
         # 获取原始文档中的上下文
         start = max(0, original_position - context_length)
         end = min(len(self.knowledge_base), original_position + context_length)
         context = self.knowledge_base[start:end]
 
         # 清理上下文中的Markdown标记
-        clean_context = re.sub(r'[#*`_]', '', context)
-        words = clean_context.split()
+        clean_context = _MD_MARK_RE.sub('', context)
 
-        # 提取一些独特的词语作为搜索锚点
-        search_anchors = []
-        for word in words:
-            if len(word) > 4 and word.isalnum():  # 选择较长的单词作为锚点
-                search_anchors.append(word)
+        # 提取一些独特的词语作为搜索锚点，限制锚点数量
+        search_anchors = [m.group() for m in islice(_ANCHOR_RE.finditer(clean_context), 5)]
 
-        # 限制锚点数量
-        search_anchors = search_anchors[:5]
+        if not search_anchors:
+            return None
 
-        # 在渲染后的文本中寻找这些锚点
-        for anchor in search_anchors:
-            pos = self.content_text.search(anchor, "1.0", stopindex=tk.END)
-            if pos:
-                # 找到了一个锚点
-                return pos
+        # 估计渲染后所在的行，只搜索其前后window行
+        if approx_line is None:
+            rendered = self._rendered_index(original_position)
+            approx_line = int(rendered.split('.')[0]) if rendered else self._line_col(original_position)[0]
+        start_idx = f"{max(1, approx_line - window)}.0"
+        stop_idx = f"{approx_line + window}.end"
+
+        # 在渲染后的文本中寻找这些锚点，附近都找不到时再搜索全文
+        for search_start, search_stop in ((start_idx, stop_idx), ("1.0", tk.END)):
+            for anchor in search_anchors:
+                pos = self.content_text.search(anchor, search_start, stopindex=search_stop)
+                if pos:
+                    # 找到了一个锚点
+                    return pos
 
         return None
 
     def show_help(self):
         """显示使用帮助"""
-        help_text = """
-            知识库语音导航系统 - 使用帮助
-
-            基本操作:
-            -----------
-            1. 加载知识库:
-               - 点击"文件" → "打开知识库"选择Markdown或文本文件
-
-            2. 浏览内容:
-               - 直接滚动浏览文档内容
-               - 点击右侧目录树跳转到对应章节
-
-            3. 搜索功能:
-               - 在搜索框输入关键词，按Enter或点击"搜索"
-               - 点击左侧结果列表跳转到匹配位置
-               - 使用"清除"按钮重置搜索结果
-
-            4. 语音功能:
-               - 点击"开始监听"启动语音识别
-               - 说出要查找的内容或关键词
-               - 使用"处理长对话"分析多句组合查询
-
-            高级功能:
-            -----------
-            - 更改语音引擎: "设置" → "语音识别引擎"
-            - 调整模糊匹配: "设置" → "搜索设置"和"模糊匹配灵敏度"
-            - 字体调整: "视图" → "放大字体"/"缩小字体"
-            - 目录展开/折叠: "视图" → "展开所有目录"/"折叠所有目录"
-
-            快捷操作:
-            -----------
-            - 搜索框中按Enter直接搜索
-            - 语音识别后自动执行搜索
-            - 点击搜索结果或目录项快速跳转
-        """
+        if self._help_window is not None and self._help_window.winfo_exists():
+            self._help_window.deiconify()
+            self._help_window.lift()
+            return
 
-        help_window = tk.Toplevel(self.root)
+        help_window = self._help_window = tk.Toplevel(self.root)
         help_window.title("使用帮助")
         help_window.geometry("600x500")
         help_window.transient(self.root)
 
         help_text_widget = scrolledtext.ScrolledText(help_window, wrap=tk.WORD, width=80, height=30)
         help_text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        help_text_widget.insert(tk.END, help_text)
+        help_text_widget.insert(tk.END, _HELP_TEXT)
         help_text_widget.config(state=tk.DISABLED)
 
-        close_button = tk.Button(help_window, text="关闭", command=help_window.destroy, width=10, height=1)
+        close_button = tk.Button(help_window, text="关闭", command=help_window.withdraw, width=10, height=1)
         close_button.pack(pady=10)
+        help_window.protocol("WM_DELETE_WINDOW", help_window.withdraw)
 
     def show_about(self):
         """显示关于信息"""
-        about_text = """
-            知识库语音导航系统
-
-            版本: 1.0
-
-            这是一个帮助用户通过语音和文本搜索快速浏览知识库的工具。
-            支持Markdown和文本格式的知识库文件，提供语音控制、模糊匹配等功能。
-
-            功能特点:
-            - 支持语音搜索和导航
-            - 智能关键词提取和模糊匹配
-            - 多种语音引擎支持
-            - 长语句理解和处理
-
-            © 2025 知识库语音导航系统团队
-        """
-        self.messagebox.showinfo("关于", about_text)
+        self.messagebox.showinfo("关于", _ABOUT_TEXT)
 
 
 def main():
+    root = None
     try:
-        # 禁用系统提示音
-        disable_system_sounds()
-
         # 创建主窗口
         root = tk.Tk()
+
+        # 禁用系统提示音，Tk部分需要在主窗口创建后设置
+        disable_system_sounds()
+
         app = KnowledgeNavigator(root)
 
-        # 使窗口处于屏幕中央
-        root.update_idletasks()
-        width = root.winfo_width()
-        height = root.winfo_height()
-        x = (root.winfo_screenwidth() // 2) - (width // 2)
-        y = (root.winfo_screenheight() // 2) - (height // 2)
-        root.geometry(f"{width}x{height}+{x}+{y}")
+        # 使窗口处于屏幕中央，窗口大小已知，不必等待布局完成
+        x = (root.winfo_screenwidth() // 2) - (_WINDOW_WIDTH // 2)
+        y = (root.winfo_screenheight() // 2) - (_WINDOW_HEIGHT // 2)
+        root.geometry(f"{_WINDOW_WIDTH}x{_WINDOW_HEIGHT}+{x}+{y}")
 
         root.mainloop()
     except Exception as e:
-        print(f"程序运行出错: {str(e)}")
-        messagebox.showinfo("错误", f"程序运行出错: {str(e)}")
-        # self.status_bar.config(text=f"提示：没有识别到完整的语音内容")
+        sys.stderr.write(f"程序运行出错: {e}\n")
+        traceback.print_exc()
+
+        # 主窗口仍然可用时才弹出对话框，避免在已损坏的Tk上阻塞
+        try:
+            if root is not None and root.winfo_exists():
+                messagebox.showerror("错误", f"程序运行出错: {e}")
+        except Exception:
+            pass
 
 
 if __name__ == "__main__":